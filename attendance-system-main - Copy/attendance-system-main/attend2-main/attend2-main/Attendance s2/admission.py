@@ -0,0 +1,90 @@
+"""
+Admission control
+A fixed number of recognition slots with a short, bounded wait queue in front
+of them. When every slot is busy and the queue is full, or a request has
+waited too long, the request is turned away at once with a suggested retry
+delay. A busy server then answers some kiosks quickly instead of answering
+all of them slowly.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """Raised by AdmissionControl.admit; reason is 'queue_full' or 'timeout', retry_after is in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f'overloaded ({reason})')
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """At most `slots` requests run at once, at most `max_queue` wait, each for at most `max_wait` seconds"""
+
+    def __init__(self, slots, max_queue, max_wait, on_change=None):
+        self.slots = max(1, slots)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        # Called with (in_flight, waiting) whenever either changes, e.g. to update gauges
+        self.on_change = on_change
+        self.in_flight = 0
+        self.waiting = 0
+        # Smoothed time a request holds its slot, used to suggest a retry delay
+        self.service_seconds = 0.25
+        self._cond = threading.Condition()
+
+    def retry_after(self):
+        """Whole seconds until the queue ahead of a new request should have drained (at least 1)"""
+        backlog = (self.waiting + 1) / self.slots
+        return max(1, math.ceil(backlog * self.service_seconds))
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self.in_flight, self.waiting)
+
+    def _acquire(self):
+        """Wait for a slot; returns the seconds waited or raises Overloaded"""
+        start = time.monotonic()
+        with self._cond:
+            if self.in_flight < self.slots and not self.waiting:
+                self.in_flight += 1
+                self._changed()
+                return 0.0
+            if self.waiting >= self.max_queue:
+                raise Overloaded('queue_full', self.retry_after())
+            self.waiting += 1
+            self._changed()
+            deadline = start + self.max_wait
+            try:
+                while self.in_flight >= self.slots:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Overloaded('timeout', self.retry_after())
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+                self._changed()
+            self.in_flight += 1
+            self._changed()
+        return time.monotonic() - start
+
+    def _release(self, held):
+        with self._cond:
+            self.in_flight -= 1
+            self.service_seconds += 0.1 * (held - self.service_seconds)
+            self._changed()
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self):
+        """Hold a slot for the enclosed block; yields the seconds spent queued"""
+        waited = self._acquire()
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._release(time.monotonic() - start)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Term Archival
+Moves the attendance rows of a closed term out of attendance.db into their own
+SQLite file (archive/attendance_<term>.db), records the term in
+attendance_terms, then runs ANALYZE and VACUUM on the hot database so
+day-to-day queries only ever scan the current term. /api/attendance/history
+reads archived terms back through ATTACH DATABASE.
+
+Usage:
+    python archive.py close 2025-T1 --start 2025-01-06 --end 2025-04-04
+    python archive.py list
+    python archive.py maintain          # ANALYZE + VACUUM the hot database only
+    python archive.py --tenant lincoln list   # one school of a multi-school deployment
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import date
+
+import app
+from tenancy import use_tenant
+
+TERM_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+def archive_path(name):
+    return os.path.join(app.archive_dir(), f'attendance_{name}.db')
+
+
+def maintain(conn, vacuum=True):
+    """Refresh planner statistics and return freed pages to the filesystem"""
+    conn.execute('ANALYZE')
+    conn.commit()
+    if vacuum:
+        conn.execute('VACUUM')
+
+
+def close_term(name, start, end, vacuum=True):
+    """Move attendance dated start..end (inclusive) into the term's own database; returns a summary"""
+    if not TERM_NAME.match(name):
+        raise ValueError(f'invalid term name {name!r} (letters, digits, "_", "-" and ".")')
+    if date.fromisoformat(start) > date.fromisoformat(end):
+        raise ValueError('term starts after it ends')
+    if date.fromisoformat(end) >= date.today():
+        raise ValueError('only closed terms can be archived (the end date must be in the past)')
+
+    app.init_db()
+    conn = app.get_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT name FROM attendance_terms
+            WHERE name = ? OR (start_date <= ? AND end_date >= ?)
+        ''', (name, end, start))
+        clash = cursor.fetchone()
+        if clash:
+            raise ValueError(f'term {name} overlaps already archived term {clash[0]}')
+
+        path = archive_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            # Left over from a run that stopped before the hot database was updated
+            os.remove(path)
+        hot_bytes = os.path.getsize(app.database_path())
+        started = time.perf_counter()
+
+        # Step 1: copy the term into its new file and commit it on its own. The copy is
+        # durable before anything is deleted, whatever journal mode the hot database uses.
+        cursor.execute('ATTACH DATABASE ? AS term', (path,))
+        cursor.execute('''
+            CREATE TABLE term.attendance (
+                id INTEGER PRIMARY KEY,
+                student_id INTEGER,
+                date DATE NOT NULL,
+                time TIME NOT NULL,
+                status TEXT DEFAULT 'present',
+                marked_by INTEGER
+            )
+        ''')
+        cursor.execute('CREATE INDEX term.idx_attendance_date ON attendance (date)')
+        cursor.execute('CREATE INDEX term.idx_attendance_student_date ON attendance (student_id, date)')
+        cursor.execute('CREATE TABLE term.term_info (name TEXT, start_date DATE, end_date DATE)')
+        cursor.execute('INSERT INTO term.term_info VALUES (?, ?, ?)', (name, start, end))
+        cursor.execute('''
+            INSERT INTO term.attendance (id, student_id, date, time, status, marked_by)
+            SELECT id, student_id, date, time, status, marked_by FROM main.attendance
+            WHERE date BETWEEN ? AND ?
+        ''', (start, end))
+        copied = cursor.rowcount
+        conn.commit()
+        cursor.execute('ANALYZE term')
+        conn.commit()
+        cursor.execute('DETACH DATABASE term')
+
+        # Step 2: drop the rows from the hot table and register the term in one transaction
+        cursor.execute('DELETE FROM attendance WHERE date BETWEEN ? AND ?', (start, end))
+        if cursor.rowcount != copied:
+            conn.rollback()
+            raise RuntimeError(f'attendance changed during archival ({copied} copied, {cursor.rowcount} to delete)')
+        cursor.execute('''
+            INSERT INTO attendance_terms (name, start_date, end_date, file, rows)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (name, start, end, os.path.basename(path), copied))
+        conn.commit()
+
+        maintain(conn, vacuum)
+    finally:
+        conn.close()
+
+    summary = {
+        'term': name,
+        'rows': copied,
+        'archive': path,
+        'archive_bytes': os.path.getsize(path),
+        'hot_bytes_before': hot_bytes,
+        'hot_bytes_after': os.path.getsize(app.database_path()),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    app.logger.info("event=term_archived term=%s rows=%d hot_bytes_before=%d hot_bytes_after=%d duration_ms=%.1f",
+                    name, copied, hot_bytes, summary['hot_bytes_after'], summary['seconds'] * 1000)
+    return summary
+
+
+def list_terms():
+    conn = app.get_db()
+    try:
+        return conn.execute('''
+            SELECT name, start_date, end_date, rows, file, archived_at
+            FROM attendance_terms ORDER BY start_date
+        ''').fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive closed terms out of the hot attendance table')
+    parser.add_argument('--tenant', help='school to work on when TENANT_MODE is set (default: DATABASE_PATH)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    close = commands.add_parser('close', help='archive one closed term')
+    close.add_argument('name', help='term name, e.g. 2025-T1')
+    close.add_argument('--start', required=True, help='first day of the term (YYYY-MM-DD)')
+    close.add_argument('--end', required=True, help='last day of the term (YYYY-MM-DD)')
+    close.add_argument('--no-vacuum', action='store_true',
+                       help='skip VACUUM (it rewrites the whole database; run it off-hours)')
+    commands.add_parser('list', help='show archived terms')
+    maintenance = commands.add_parser('maintain', help='ANALYZE and VACUUM the hot database')
+    maintenance.add_argument('--no-vacuum', action='store_true')
+    args = parser.parse_args()
+
+    with use_tenant(args.tenant):
+        run(args)
+
+
+def run(args):
+    if args.command == 'close':
+        try:
+            summary = close_term(args.name, args.start, args.end, vacuum=not args.no_vacuum)
+        except (ValueError, RuntimeError, sqlite3.Error) as e:
+            sys.exit(f'archive failed: {e}')
+        print(f"{summary['term']}: {summary['rows']} rows -> {summary['archive']} ({summary['archive_bytes']} bytes); "
+              f"hot database {summary['hot_bytes_before']} -> {summary['hot_bytes_after']} bytes "
+              f"in {summary['seconds']}s")
+    elif args.command == 'list':
+        for name, start, end, rows, file, archived_at in list_terms():
+            print(f'{name:<16}{start} .. {end}{rows:>10} rows  {file}  (archived {archived_at})')
+    else:
+        app.init_db()
+        conn = app.get_db()
+        try:
+            maintain(conn, vacuum=not args.no_vacuum)
+        finally:
+            conn.close()
+        print(f'{app.database_path()}: {os.path.getsize(app.database_path())} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Static Asset Pipeline
+Copies everything under static/ into static/dist/ with content-hashed file
+names (style.3f9a1c02be.css) and precompressed .gz/.br siblings, then writes
+dist/manifest.json mapping each source path to its hashed one. The app serves
+dist/ with an immutable Cache-Control, so browsers only refetch a file when
+its contents change.
+
+Usage:
+    python assets.py                 # build static/dist
+    python assets.py --clean         # remove static/dist first
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_NAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Fonts other than woff2 and images are already compressed; precompressing them wastes disk
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.ttf', '.map'}
+COMPRESS_MIN_BYTES = 1024
+HASH_LENGTH = 10
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def hashed_name(path, content):
+    """style/app.css + bytes -> style/app.<sha256[:10]>.css"""
+    root, ext = os.path.splitext(path)
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    return f'{root}.{digest}{ext}'
+
+
+def rewrite_css_urls(css_path, css, manifest):
+    """Point relative url() references in a stylesheet at their hashed names"""
+    base = os.path.dirname(css_path)
+
+    def replace(match):
+        quote, url = match.group(1), match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        # Keep any ?query or #fragment (font files use #iefix and friends)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = os.path.normpath(os.path.join(base, path)).replace(os.sep, '/')
+        if target not in manifest:
+            return match.group(0)
+        relative = os.path.relpath(manifest[target], base or '.').replace(os.sep, '/')
+        return f'url({quote}{relative}{suffix}{quote})'
+
+    return CSS_URL.sub(replace, css)
+
+
+def write_variants(path, content):
+    """Write `path` plus .gz (and .br when brotli is installed) for compressible types"""
+    with open(path, 'wb') as f:
+        f.write(content)
+    written = {'raw': len(content)}
+    if os.path.splitext(path)[1] not in COMPRESSIBLE or len(content) < COMPRESS_MIN_BYTES:
+        return written
+    # mtime=0 keeps the .gz byte-identical across builds of the same content
+    gz = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gz) < len(content):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gz)
+        written['gzip'] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(content, quality=11)
+        if len(br) < len(content):
+            with open(path + '.br', 'wb') as f:
+                f.write(br)
+            written['br'] = len(br)
+    return written
+
+
+def source_files(static_dir):
+    """Every file under static/ except the build output, as forward-slash relative paths"""
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.samefile(root, static_dir):
+            dirs[:] = [d for d in dirs if d != DIST_NAME]
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, '/')
+
+
+def build(static_dir=STATIC_DIR, clean=False):
+    """Build dist/ and return {source path: {'file': hashed path, sizes...}}"""
+    dist = os.path.join(static_dir, DIST_NAME)
+    if clean and os.path.isdir(dist):
+        shutil.rmtree(dist)
+    os.makedirs(dist, exist_ok=True)
+
+    sources = sorted(source_files(static_dir))
+    # Stylesheets go last so the files they reference already have hashed names
+    ordered = [p for p in sources if not p.endswith('.css')] + [p for p in sources if p.endswith('.css')]
+    manifest = {}
+    report = {}
+    for path in ordered:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = rewrite_css_urls(path, content.decode('utf-8'), manifest).encode('utf-8')
+        target = hashed_name(path, content)
+        out = os.path.join(dist, target)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        manifest[path] = target
+        report[path] = {'file': target, **write_variants(out, content)}
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return report
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    """{source path: dist path} from the last build, or {} when assets were never built"""
+    try:
+        with open(os.path.join(static_dir, DIST_NAME, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress static assets')
+    parser.add_argument('--static-dir', default=STATIC_DIR)
+    parser.add_argument('--clean', action='store_true', help='delete the previous build first')
+    args = parser.parse_args()
+
+    report = build(args.static_dir, clean=args.clean)
+    if brotli is None:
+        print('brotli not installed; writing gzip variants only', file=sys.stderr)
+    raw = gz = br = 0
+    for path, sizes in sorted(report.items()):
+        raw += sizes['raw']
+        gz += sizes.get('gzip', sizes['raw'])
+        br += sizes.get('br', sizes.get('gzip', sizes['raw']))
+        print(f"  {path:<48}{sizes['raw']:>9}{sizes.get('gzip', '-'):>9}{sizes.get('br', '-'):>9}  -> {sizes['file']}")
+    print(f"{len(report)} assets: {raw} bytes raw, {gz} gzip, {br} best")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Attendance Pipeline Benchmark
+Times every stage of mark_attendance() and train_face_recognizer() against
+synthetic galleries, plus preprocess_face() one call per face against
+preprocess_faces() over a batch, fully offline, and writes p50/p95/p99
+results as JSON.
+
+Usage:
+    python benchmark.py                              # 100 and 1k students
+    python benchmark.py --sizes 100 1000 10000 --frames 300 --output bench.json
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import app
+from synthetic_faces import draw_face, enrollment_face, make_frame, to_data_url
+
+STAGES = [
+    'base64_decode',
+    'image_decode',
+    'color_convert',
+    'triage',
+    'detect',
+    'preprocess',
+    'predict',
+    'db',
+    'total',
+]
+
+
+def summarize(samples):
+    """Reduce a list of durations in seconds to millisecond percentiles"""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    if ms.size == 0:
+        return {'n': 0}
+    return {
+        'n': int(ms.size),
+        'mean': round(float(ms.mean()), 4),
+        'min': round(float(ms.min()), 4),
+        'p50': round(float(np.percentile(ms, 50)), 4),
+        'p95': round(float(np.percentile(ms, 95)), 4),
+        'p99': round(float(np.percentile(ms, 99)), 4),
+        'max': round(float(ms.max()), 4),
+    }
+
+
+def seed_gallery(size):
+    """Fill the (scratch) app database and face store with `size` enrolled synthetic students"""
+    faces = app.preprocess_faces([enrollment_face(i) for i in range(size)])
+    slots = app.get_face_store().extend(faces)
+
+    conn = app.get_db()
+    conn.executemany('''
+        INSERT INTO students (name, student_id, email, face_slot)
+        VALUES (?, ?, ?, ?)
+    ''', ((f'Student {i}', f'BENCH{i:06d}', f'student{i}@example.com', slot) for i, slot in enumerate(slots)))
+    conn.commit()
+    ids = [row[0] for row in conn.execute('SELECT id FROM students ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def bench_training(runs):
+    """Time train_face_recognizer() end to end"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        app.train_face_recognizer()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_preprocess(count, rounds, seed):
+    """Per-face cost of preprocessing `count` detected face crops, one call per face vs one batch call"""
+    rng = np.random.default_rng(seed)
+    # Cascade boxes come in many sizes; the routes resize each crop to 128x128 before preprocessing
+    crops = [draw_face(i, int(rng.integers(80, 320)), variation=1) for i in range(count)]
+    samples = {'per_face': [], 'batch': []}
+    for _ in range(rounds):
+        start = time.perf_counter()
+        np.stack([app.preprocess_face(cv2.resize(crop, (128, 128))) for crop in crops])
+        samples['per_face'].append((time.perf_counter() - start) / count)
+        start = time.perf_counter()
+        app.preprocess_faces([cv2.resize(crop, (128, 128)) for crop in crops])
+        samples['batch'].append((time.perf_counter() - start) / count)
+    return {'faces': count, 'rounds': rounds, 'per_face_ms': {mode: summarize(values) for mode, values in samples.items()}}
+
+
+def bench_frame(data_url):
+    """Run one kiosk frame through the same calls as mark_attendance(); return (timings, label)
+
+    Stage names match the route's stage latency metric.
+    """
+    t = {}
+    start = time.perf_counter()
+
+    t0 = time.perf_counter()
+    image_bytes = base64.b64decode(data_url.split(',')[1])
+    t['base64_decode'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    image_array = np.array(image)
+    t['image_decode'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    image_cv = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
+    t['color_convert'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    reason = app.triage_frame(image_cv)
+    t['triage'] = time.perf_counter() - t0
+    if reason:
+        return t, None
+
+    t0 = time.perf_counter()
+    faces = app.detect_faces(image_cv)
+    t['detect'] = time.perf_counter() - t0
+    if not faces or app.triage_face(faces[0], image_cv.shape):
+        return t, None
+
+    t0 = time.perf_counter()
+    x, y, w, h = faces[0]
+    face_resized = cv2.resize(image_cv[y:y+h, x:x+w], (128, 128))
+    face_gray = cv2.cvtColor(face_resized, cv2.COLOR_BGR2GRAY)
+    face_adjusted = app.preprocess_face(face_gray)
+    t['preprocess'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    label, confidence = app.predict_face(face_adjusted)
+    t['predict'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    conn = app.get_db()
+    try:
+        student = conn.execute('SELECT id, name, student_id FROM students WHERE id = ?', (label,)).fetchone()
+    finally:
+        conn.close()
+    if student:
+        app.record_marks([student[0]], 1)
+    t['db'] = time.perf_counter() - t0
+
+    t['total'] = time.perf_counter() - start
+    return t, label
+
+
+def clear_todays_marks():
+    """Forget today's marks, so the next frame's record_marks() inserts instead of finding a duplicate"""
+    conn = app.get_db()
+    conn.execute('DELETE FROM attendance WHERE date = ?', (datetime.now().date().isoformat(),))
+    conn.commit()
+    conn.close()
+
+
+def bench_gallery(size, frames, train_runs, seed):
+    """Benchmark one gallery size inside a scratch database"""
+    workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+    previous_db = app.DATABASE
+    app.DATABASE = os.path.join(workdir, 'bench.db')
+    try:
+        app.init_db()
+        print(f"[{size}] seeding gallery...", file=sys.stderr)
+        ids = seed_gallery(size)
+
+        print(f"[{size}] training ({train_runs} run(s))...", file=sys.stderr)
+        train_samples = bench_training(train_runs)
+
+        rng = np.random.default_rng(seed)
+        picks = rng.integers(0, size, frames)
+        payloads = [to_data_url(make_frame(int(i), variation=k + 1)[0]) for k, i in enumerate(picks)]
+
+        print(f"[{size}] timing {frames} frames...", file=sys.stderr)
+        samples = {stage: [] for stage in STAGES}
+        hits = correct = 0
+        for identity, payload in zip(picks, payloads):
+            # Untimed, so every frame exercises the insert path
+            clear_todays_marks()
+            timings, label = bench_frame(payload)
+            for stage, value in timings.items():
+                samples[stage].append(value)
+            if label is not None:
+                hits += 1
+                correct += int(label == ids[identity])
+
+        return {
+            'gallery_size': size,
+            'frames': frames,
+            'detection_hit_rate': round(hits / frames, 4) if frames else None,
+            'recognition_accuracy': round(correct / hits, 4) if hits else None,
+            'train_face_recognizer': summarize(train_samples),
+            'stages': {stage: summarize(values) for stage, values in samples.items()},
+        }
+    finally:
+        app.DATABASE = previous_db
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_table(results, preprocess):
+    """Human-readable summary on stderr (JSON goes to stdout or --output)"""
+    per_face = preprocess['per_face_ms']
+    print(f"\nPreprocessing {preprocess['faces']} faces: {per_face['per_face']['p50']:.4f} ms/face one call each, "
+          f"{per_face['batch']['p50']:.4f} ms/face batched (p50)", file=sys.stderr)
+    for result in results:
+        train = result['train_face_recognizer']
+        print(f"\nGallery {result['gallery_size']}: train p50 {train.get('p50')} ms, "
+              f"detect hit rate {result['detection_hit_rate']}, accuracy {result['recognition_accuracy']}",
+              file=sys.stderr)
+        print(f"  {'stage':<18}{'p50':>10}{'p95':>10}{'p99':>10}   (ms)", file=sys.stderr)
+        for stage, stats in result['stages'].items():
+            if stats.get('n'):
+                print(f"  {stage:<18}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}",
+                      file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stage-level benchmark for the attendance pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000],
+                        help='gallery sizes to benchmark (e.g. 100 1000 10000)')
+    parser.add_argument('--frames', type=int, default=200, help='kiosk frames timed per gallery')
+    parser.add_argument('--train-runs', type=int, default=1, help='train_face_recognizer() runs per gallery')
+    parser.add_argument('--preprocess-faces', type=int, default=256,
+                        help='face crops preprocessed per round, one by one and as a batch')
+    parser.add_argument('--preprocess-rounds', type=int, default=20, help='rounds of the preprocessing comparison')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for frame selection')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    cv2.setRNGSeed(args.seed)
+    preprocess = bench_preprocess(args.preprocess_faces, args.preprocess_rounds, args.seed)
+    results = [bench_gallery(size, args.frames, args.train_runs, args.seed) for size in args.sizes]
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'units': 'milliseconds',
+            'args': vars(args),
+        },
+        'preprocess': preprocess,
+        'results': results,
+    }
+
+    print_table(results, preprocess)
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(payload + '\n')
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Recognizer Comparison
+Sweeps LBPH parameters and the other cv2.face recognizers (Eigenfaces,
+Fisherfaces), plus face_recognition embeddings when that package is installed,
+over a labeled face directory or synthetic galleries. For every setting it
+measures training time, model size, per-predict latency, and how many probes
+are accepted correctly or falsely at each distance threshold. It then reports
+the best threshold under each false-accept target and marks the Pareto front
+(accuracy vs predict latency vs model size).
+
+Part of the students of each gallery are never enrolled. Their probes are
+impostors, the kiosk's worst case: a face that must not be marked as anyone.
+
+Usage:
+    python compare_recognizers.py                                  # synthetic 100 and 1k galleries
+    python compare_recognizers.py --faces-dir photos/ --output cmp.json
+        # photos/<student>/<image>.jpg; the first --enroll-images per student are enrolled
+
+    python compare_recognizers.py --radius 1 2 --neighbors 4 8 --grid 4 8 --max-far 0.001 0.01
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import app
+from benchmark import summarize
+from lbph import HistogramMatcher
+from synthetic_faces import enrollment_face
+
+try:
+    import face_recognition
+except ImportError:
+    face_recognition = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+# The routes reject a match when 1 - distance / 100 < 0.1, i.e. they accept distances up to 90
+APP_DISTANCE_CUTOFF = 90.0
+
+
+class CvEngine:
+    """A cv2.face recognizer; distances are whatever predict() returns"""
+
+    def __init__(self, name, params, factory):
+        self.name = name
+        self.params = params
+        self.factory = factory
+        self.model = None
+
+    def train(self, faces, labels):
+        self.model = self.factory()
+        self.model.train(faces, labels)
+
+    def predict(self, face):
+        return self.model.predict(face)
+
+    def nbytes(self):
+        if hasattr(self.model, 'getHistograms'):
+            return sum(h.nbytes for h in self.model.getHistograms())
+        return sum(a.nbytes for a in (self.model.getEigenVectors(), self.model.getMean(),
+                                      *self.model.getProjections()))
+
+
+class EmbeddingEngine:
+    """face_recognition (dlib ResNet) 128-d embeddings with nearest-neighbour Euclidean distance"""
+
+    name = 'face_recognition'
+    params = {'model': 'dlib_resnet'}
+
+    def __init__(self):
+        self.encodings = None
+        self.labels = None
+
+    @staticmethod
+    def encode(face):
+        # Faces are already cropped, so the whole image is the face location
+        rgb = cv2.cvtColor(face, cv2.COLOR_GRAY2RGB)
+        h, w = face.shape
+        return face_recognition.face_encodings(rgb, known_face_locations=[(0, w, h, 0)])[0]
+
+    def train(self, faces, labels):
+        self.encodings = np.stack([self.encode(face) for face in faces])
+        self.labels = np.asarray(labels)
+
+    def predict(self, face):
+        distances = np.linalg.norm(self.encodings - self.encode(face), axis=1)
+        best = int(distances.argmin())
+        return int(self.labels[best]), float(distances[best])
+
+    def nbytes(self):
+        return self.encodings.nbytes + self.labels.nbytes
+
+
+def engines(args):
+    """Every recognizer setting to compare"""
+    for radius, neighbors, grid in itertools.product(args.radius, args.neighbors, args.grid):
+        params = {'radius': radius, 'neighbors': neighbors, 'grid_x': grid, 'grid_y': grid}
+        yield CvEngine('lbph', params,
+                       lambda p=params: cv2.face.LBPHFaceRecognizer_create(**p, threshold=float('inf')))
+    for components in args.eigen_components:
+        yield CvEngine('eigen', {'num_components': components},
+                       lambda c=components: cv2.face.EigenFaceRecognizer_create(num_components=c))
+    # Fisherfaces needs at least two enrolled images of some students
+    yield CvEngine('fisher', {'num_components': 0}, cv2.face.FisherFaceRecognizer_create)
+    if face_recognition is not None:
+        yield EmbeddingEngine()
+
+
+def synthetic_set(size, enroll_images, probes, impostors, seed):
+    """(gallery faces, gallery labels, probe faces, probe labels); impostor probes have label -1"""
+    rng = np.random.default_rng(seed)
+    gallery, labels = [], []
+    for identity in range(size):
+        for k in range(enroll_images):
+            gallery.append(enrollment_face(identity, variation=1000 + k if k else 0))
+            labels.append(identity)
+    probe_faces, probe_labels = [], []
+    for k, identity in enumerate(rng.integers(0, size, probes)):
+        probe_faces.append(enrollment_face(int(identity), variation=k + 1))
+        probe_labels.append(int(identity))
+    # Identities past the gallery were never enrolled
+    for k in range(impostors):
+        probe_faces.append(enrollment_face(size + k, variation=k + 1))
+        probe_labels.append(-1)
+    return (app.preprocess_faces(gallery), np.array(labels, np.int32),
+            app.preprocess_faces(probe_faces), np.array(probe_labels))
+
+
+def load_face(path):
+    """A grayscale face crop from a photo; the largest detected face, or the whole image if none"""
+    image = cv2.imread(path)
+    if image is None:
+        return None
+    faces = app.detect_faces(image)
+    if faces:
+        x, y, w, h = max(faces, key=lambda box: box[2] * box[3])
+        image = cv2.resize(image[y:y + h, x:x + w], (128, 128))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def directory_set(faces_dir, enroll_images, impostor_share, seed):
+    """Split <faces_dir>/<student>/* into gallery and probes; a share of the students is never enrolled"""
+    people = sorted(name for name in os.listdir(faces_dir) if os.path.isdir(os.path.join(faces_dir, name)))
+    rng = np.random.default_rng(seed)
+    impostors = set(rng.choice(len(people), int(round(len(people) * impostor_share)), replace=False).tolist())
+    gallery, labels, probe_faces, probe_labels = [], [], [], []
+    for index, person in enumerate(people):
+        folder = os.path.join(faces_dir, person)
+        faces = [face for face in (load_face(os.path.join(folder, name)) for name in sorted(os.listdir(folder))
+                                   if name.lower().endswith(IMAGE_EXTENSIONS)) if face is not None]
+        if index in impostors:
+            probe_faces.extend(faces)
+            probe_labels.extend([-1] * len(faces))
+            continue
+        gallery.extend(faces[:enroll_images])
+        labels.extend([index] * len(faces[:enroll_images]))
+        probe_faces.extend(faces[enroll_images:])
+        probe_labels.extend([index] * len(faces[enroll_images:]))
+    if not gallery or not probe_faces:
+        raise SystemExit(f'{faces_dir}: need <student>/<image> folders with more than --enroll-images photos')
+    return (app.preprocess_faces(gallery), np.array(labels, np.int32),
+            app.preprocess_faces(probe_faces), np.array(probe_labels))
+
+
+def operating_points(labels, predicted, distances, max_fars):
+    """Accuracy at the app's cutoff, and the threshold with the most correct accepts under each FAR target
+
+    tar: genuine probes accepted as the right student. far: impostor probes accepted
+    as anyone. misid: genuine probes accepted as the wrong student. A threshold
+    meets a target when both far and misid stay within it.
+    """
+    genuine = labels >= 0
+    n_genuine, n_impostor = max(int(genuine.sum()), 1), max(int((~genuine).sum()), 1)
+    correct = genuine & (predicted == labels)
+
+    def at(threshold):
+        accepted = distances <= threshold
+        return {
+            'threshold': round(float(threshold), 4),
+            'tar': round(float((accepted & correct).sum()) / n_genuine, 4),
+            'far': round(float((accepted & ~genuine).sum()) / n_impostor, 4),
+            'misid': round(float((accepted & genuine & ~correct).sum()) / n_genuine, 4),
+        }
+
+    candidates = [at(threshold) for threshold in np.unique(distances)]
+    targets = {}
+    for max_far in max_fars:
+        allowed = [point for point in candidates if point['far'] <= max_far and point['misid'] <= max_far]
+        targets[str(max_far)] = max(allowed, key=lambda point: point['tar']) if allowed else None
+    return {
+        'rank1_accuracy': round(float(correct.sum()) / n_genuine, 4),
+        'app_cutoff': at(APP_DISTANCE_CUTOFF),
+        'targets': targets,
+    }
+
+
+def evaluate(engine, gallery, labels, probe_faces, probe_labels, max_fars):
+    """Train one engine on the gallery and score every probe"""
+    result = {'engine': engine.name, 'params': engine.params}
+    start = time.perf_counter()
+    try:
+        engine.train(gallery, labels)
+    except cv2.error as e:
+        result['error'] = str(e).strip().splitlines()[-1]
+        return result
+    result['train_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    result['model_bytes'] = int(engine.nbytes())
+
+    predicted, distances, latencies = [], [], []
+    for face in probe_faces:
+        t0 = time.perf_counter()
+        label, distance = engine.predict(face)
+        latencies.append(time.perf_counter() - t0)
+        predicted.append(label)
+        distances.append(distance)
+    result['predict'] = summarize(latencies)
+    if engine.name == 'lbph':
+        # The same probes through the NumPy matcher the batch route uses, all in one call
+        matcher = HistogramMatcher.from_recognizer(engine.model)
+        t0 = time.perf_counter()
+        batch = matcher.predict(probe_faces)
+        result['batch_predict_per_face_ms'] = round((time.perf_counter() - t0) * 1000 / len(probe_faces), 4)
+        result['batch_agreement'] = round(float(np.mean([a[0] == b for a, b in zip(batch, predicted)])), 4)
+    result.update(operating_points(probe_labels, np.array(predicted), np.array(distances, np.float64), max_fars))
+    return result
+
+
+def mark_pareto(results, max_far):
+    """Flag settings no other setting beats on TAR (at max_far), predict p50 and model size at once"""
+    scored = [r for r in results if 'error' not in r]
+
+    def score(r):
+        point = r['targets'][str(max_far)]
+        return (point['tar'] if point else 0.0, -r['predict']['p50'], -r['model_bytes'])
+
+    for r in scored:
+        mine = score(r)
+        r['pareto'] = not any(
+            all(a >= b for a, b in zip(score(other), mine)) and score(other) != mine for other in scored)
+
+
+def compare(gallery, labels, probe_faces, probe_labels, args):
+    print(f"[{len(np.unique(labels))} students] {len(gallery)} enrolled faces, "
+          f"{int((probe_labels >= 0).sum())} genuine and {int((probe_labels < 0).sum())} impostor probes",
+          file=sys.stderr)
+    results = []
+    for engine in engines(args):
+        print(f"  {engine.name} {engine.params}...", file=sys.stderr)
+        results.append(evaluate(engine, gallery, labels, probe_faces, probe_labels, args.max_far))
+    mark_pareto(results, args.max_far[0])
+    return {
+        'gallery_size': int(len(np.unique(labels))),
+        'enrolled_faces': int(len(gallery)),
+        'probes': int(len(probe_faces)),
+        'results': results,
+    }
+
+
+def describe(result):
+    if result['engine'] == 'lbph':
+        p = result['params']
+        return f"lbph r{p['radius']} n{p['neighbors']} {p['grid_x']}x{p['grid_y']}"
+    if 'num_components' in result['params']:
+        return f"{result['engine']} k={result['params']['num_components'] or 'all'}"
+    return result['engine']
+
+
+def print_table(galleries, max_far):
+    """Human-readable summary on stderr (JSON goes to stdout or --output)"""
+    for gallery in galleries:
+        print(f"\nGallery {gallery['gallery_size']} (tar/threshold at far <= {max_far}; * = Pareto front)",
+              file=sys.stderr)
+        print(f"  {'setting':<22}{'train ms':>10}{'model KB':>10}{'p50 ms':>9}{'p95 ms':>9}"
+              f"{'rank1':>7}{'tar':>7}{'thresh':>9}{'app tar':>9}{'app far':>9}", file=sys.stderr)
+        for r in gallery['results']:
+            if 'error' in r:
+                print(f"  {describe(r):<22}skipped: {r['error']}", file=sys.stderr)
+                continue
+            point = r['targets'][str(max_far)] or {'tar': 0.0, 'threshold': float('nan')}
+            print(f"{'*' if r['pareto'] else ' '} {describe(r):<22}{r['train_ms']:>10.1f}"
+                  f"{r['model_bytes'] / 1024:>10.0f}{r['predict']['p50']:>9.3f}{r['predict']['p95']:>9.3f}"
+                  f"{r['rank1_accuracy']:>7.3f}{point['tar']:>7.3f}{point['threshold']:>9.2f}"
+                  f"{r['app_cutoff']['tar']:>9.3f}{r['app_cutoff']['far']:>9.3f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare face recognizer settings on accuracy, FAR, speed and size')
+    parser.add_argument('--faces-dir', help='labeled photos as <dir>/<student>/<image> (default: synthetic faces)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000],
+                        help='synthetic gallery sizes (students enrolled)')
+    parser.add_argument('--probes', type=int, default=200, help='synthetic genuine probes per gallery')
+    parser.add_argument('--impostors', type=int, default=100, help='synthetic impostor probes per gallery')
+    parser.add_argument('--impostor-share', type=float, default=0.2,
+                        help='share of --faces-dir students kept out of the gallery as impostors')
+    parser.add_argument('--enroll-images', type=int, default=1,
+                        help='enrolled photos per student (the app enrolls one)')
+    parser.add_argument('--radius', type=int, nargs='+', default=[1, 2], help='LBPH radii to sweep')
+    parser.add_argument('--neighbors', type=int, nargs='+', default=[4, 8], help='LBPH neighbor counts to sweep')
+    parser.add_argument('--grid', type=int, nargs='+', default=[4, 8], help='LBPH grid sizes (grid_x = grid_y)')
+    parser.add_argument('--eigen-components', type=int, nargs='+', default=[0, 50],
+                        help='Eigenfaces components (0 = all)')
+    parser.add_argument('--max-far', type=float, nargs='+', default=[0.01, 0.001],
+                        help='false-accept targets; the first one decides the Pareto front')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for probe and impostor selection')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    cv2.setRNGSeed(args.seed)
+    if face_recognition is None:
+        print("face_recognition is not installed; comparing cv2.face recognizers only", file=sys.stderr)
+    if args.faces_dir:
+        galleries = [compare(*directory_set(args.faces_dir, args.enroll_images, args.impostor_share, args.seed),
+                             args)]
+    else:
+        galleries = [compare(*synthetic_set(size, args.enroll_images, args.probes, args.impostors, args.seed), args)
+                     for size in args.sizes]
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'face_recognition': face_recognition is not None,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'units': 'milliseconds',
+            'app_distance_cutoff': APP_DISTANCE_CUTOFF,
+            'args': vars(args),
+        },
+        'galleries': galleries,
+    }
+
+    print_table(galleries, args.max_far[0])
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(payload + '\n')
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+
+if __name__ == '__main__':
+    main()
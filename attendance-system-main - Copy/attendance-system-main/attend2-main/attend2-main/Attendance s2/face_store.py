@@ -0,0 +1,162 @@
+"""
+Face store
+Preprocessed 128x128 grayscale faces kept in a fixed-stride raw uint8 file.
+Slot i lives at byte offset i * 128 * 128, so appends are O(1) and the whole
+gallery can be memory-mapped as an (N, 128, 128) array without decoding or copying.
+Writers take an exclusive lock on a sidecar .lock file, so several server
+processes can share one store.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process servers only, the thread lock is enough
+    fcntl = None
+
+FACE_SHAPE = (128, 128)
+
+
+class FaceStore:
+    def __init__(self, path, shape=FACE_SHAPE):
+        self.path = path
+        self.shape = tuple(shape)
+        self.stride = int(np.prod(self.shape))
+        self._lock = threading.RLock()
+        self._map = None
+        self._map_key = None
+        self._writer = threading.RLock()
+        self._writer_depth = 0
+        self._writer_fd = None
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.path) // self.stride
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def locked(self):
+        """Exclusive access for this thread across threads and processes (re-entrant)"""
+        with self._writer:
+            if self._writer_depth == 0 and fcntl is not None:
+                self._writer_fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._writer_fd, fcntl.LOCK_EX)
+            self._writer_depth += 1
+            try:
+                yield self
+            finally:
+                self._writer_depth -= 1
+                if self._writer_depth == 0 and self._writer_fd is not None:
+                    fcntl.flock(self._writer_fd, fcntl.LOCK_UN)
+                    os.close(self._writer_fd)
+                    self._writer_fd = None
+
+    def _check(self, face):
+        face = np.ascontiguousarray(face, dtype=np.uint8)
+        if face.shape != self.shape:
+            raise ValueError(f'face must be {self.shape}, got {face.shape}')
+        return face
+
+    def append(self, face):
+        """Append one face and return its slot number"""
+        face = self._check(face)
+        with self.locked():
+            return self._write_slots(face.tobytes())
+
+    def extend(self, faces):
+        """Append a stack of faces in one write and return the range of slots used"""
+        faces = np.ascontiguousarray(faces, dtype=np.uint8)
+        if faces.ndim != 3 or faces.shape[1:] != self.shape:
+            raise ValueError(f'faces must be (N, {self.shape[0]}, {self.shape[1]}), got {faces.shape}')
+        with self.locked():
+            first = self._write_slots(faces.tobytes())
+            return range(first, first + len(faces))
+
+    def _write_slots(self, data):
+        """Write whole faces after the last whole slot (caller holds the lock); returns the first new slot
+
+        A crash or a full disk can leave a partial face at the end of the file. It is
+        overwritten rather than appended to, so later slots stay at slot * stride.
+        """
+        with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+            slot = os.fstat(f.fileno()).st_size // self.stride
+            f.seek(slot * self.stride)
+            f.write(data)
+            f.truncate()
+        return slot
+
+    def faces(self):
+        """Read-only (N, 128, 128) memory map of every slot; remapped only when the file changes"""
+        try:
+            stat = os.stat(self.path)
+            # The inode changes when another process compacts the file and swaps it in
+            key = (stat.st_ino, stat.st_size // self.stride)
+        except FileNotFoundError:
+            key = (None, 0)
+        count = key[1]
+        with self._lock:
+            if self._map is None or self._map_key != key:
+                if count == 0:
+                    self._map = np.empty((0,) + self.shape, np.uint8)
+                else:
+                    self._map = np.memmap(self.path, dtype=np.uint8, mode='r', shape=(count,) + self.shape)
+                self._map_key = key
+            return self._map
+
+    def get(self, slot):
+        """Zero-copy view of one face"""
+        faces = self.faces()
+        if not 0 <= slot < len(faces):
+            raise IndexError(f'face slot {slot} out of range')
+        return faces[slot]
+
+    @property
+    def compact_path(self):
+        return self.path + '.compact'
+
+    def compact(self, keep_slots):
+        """Write a copy of the file with only `keep_slots`, in order, next to it
+
+        Old slot keep_slots[i] becomes slot i once finish_compaction() swaps the copy
+        in. Until then the store is unchanged, so the caller can first commit the
+        matching slot numbers, and discard_compaction() the copy if that fails.
+        """
+        keep_slots = np.asarray(keep_slots, dtype=np.int64)
+        with self.locked(), self._lock:
+            faces = self.faces()
+            if len(keep_slots) and keep_slots.max() >= len(faces):
+                raise IndexError(f'face slot {int(keep_slots.max())} out of range')
+            # Copy in chunks so a huge gallery is never gathered into memory at once
+            with open(self.compact_path, 'wb') as f:
+                for first in range(0, len(keep_slots), 4096):
+                    f.write(np.ascontiguousarray(faces[keep_slots[first:first + 4096]]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def pending_compaction(self):
+        """Faces in a compacted copy that has not been swapped in yet (left by a crash), or None"""
+        try:
+            return os.path.getsize(self.compact_path) // self.stride
+        except FileNotFoundError:
+            return None
+
+    def finish_compaction(self):
+        """Swap the compacted copy in"""
+        with self.locked(), self._lock:
+            # Existing memory maps keep reading the old file until they are dropped
+            os.replace(self.compact_path, self.path)
+            self._map = None
+            self._map_key = None
+
+    def discard_compaction(self):
+        """Drop the compacted copy and keep the store as it is"""
+        with self.locked():
+            try:
+                os.remove(self.compact_path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+End-of-Day Finalization
+Closes past school days. For each day it marks check-ins after the late
+cutoff as 'late', writes an 'absent' row for every student with no mark
+(one INSERT ... SELECT), and stores the day's counts in attendance_days. After
+that, absences are ordinary rows, and per-student and per-day figures are
+indexed aggregates. A school day is any day on which somebody was marked.
+Days with no marks at all (weekends, holidays) are left alone unless named
+with --date.
+
+Run it from cron after the school day, e.g. `15 18 * * 1-5 python finalize.py`.
+Every day is finalized in its own transaction and only once, so overlapping
+runs are harmless.
+
+Usage:
+    python finalize.py                       # every past school day not finalized yet
+    python finalize.py --date 2025-03-14     # one day (with no marks, everyone is absent)
+    python finalize.py --cutoff 08:30        # late cutoff (default LATE_CUTOFF or 08:15)
+    python finalize.py --tenant lincoln      # one school (default: all schools in TENANT_MODE)
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+
+import app
+from tenancy import list_tenants, use_tenant
+
+LATE_CUTOFF = os.getenv('LATE_CUTOFF', '08:15')
+# Absent rows have no check-in; time is NOT NULL, so they get midnight
+ABSENT_TIME = '00:00:00'
+
+
+def parse_cutoff(value):
+    """'08:15' or '08:15:00' -> '08:15:00' (attendance times are stored as HH:MM:SS)"""
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%H:%M:%S')
+        except ValueError:
+            pass
+    raise ValueError(f'invalid late cutoff {value!r} (expected HH:MM)')
+
+
+def pending_days(conn, today):
+    """Past days that have marks but have not been finalized, oldest first"""
+    return [row[0] for row in conn.execute('''
+        SELECT DISTINCT date FROM attendance
+        WHERE date < ? AND date NOT IN (SELECT date FROM attendance_days)
+        ORDER BY date
+    ''', (today,)).fetchall()]
+
+
+def finalize_day(conn, day, cutoff):
+    """Close one day in a single transaction; returns its counts, or None if it was already finalized"""
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    # IMMEDIATE takes the write lock up front, so two runs cannot both close the same day
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('SELECT 1 FROM attendance_days WHERE date = ?', (day,))
+        if cursor.fetchone():
+            conn.rollback()
+            return None
+        cursor.execute('''
+            UPDATE attendance SET status = 'late'
+            WHERE date = ? AND status = 'present' AND time > ?
+        ''', (day, cutoff))
+        # Students enrolled after the day are not absent from it
+        cursor.execute('''
+            INSERT INTO attendance (student_id, date, time, status, marked_by)
+            SELECT s.id, :day, :time, 'absent', NULL
+            FROM students s
+            WHERE date(s.created_at) <= :day
+              AND NOT EXISTS (SELECT 1 FROM attendance a WHERE a.student_id = s.id AND a.date = :day)
+        ''', {'day': day, 'time': ABSENT_TIME})
+        cursor.execute('''
+            SELECT
+                COALESCE(SUM(status = 'present'), 0),
+                COALESCE(SUM(status = 'late'), 0),
+                COALESCE(SUM(status = 'absent'), 0)
+            FROM attendance WHERE date = ?
+        ''', (day,))
+        present, late, absent = cursor.fetchone()
+        cursor.execute('''
+            INSERT INTO attendance_days (date, late_cutoff, present, late, absent)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (day, cutoff, present, late, absent))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    app.logger.info("event=day_finalized date=%s present=%d late=%d absent=%d duration_ms=%.1f",
+                    day, present, late, absent, (time.perf_counter() - start) * 1000)
+    return {'date': day, 'present': present, 'late': late, 'absent': absent}
+
+
+def finalize(days=None, cutoff=LATE_CUTOFF):
+    """Finalize the given days (default: every pending one) in the current database; returns their counts"""
+    cutoff = parse_cutoff(cutoff)
+    today = date.today().isoformat()
+    app.ensure_database()
+    conn = app.get_db()
+    try:
+        if days is None:
+            days = pending_days(conn, today)
+        results = []
+        for day in days:
+            if date.fromisoformat(day).isoformat() >= today:
+                raise ValueError(f'{day} is not over yet; only past days can be finalized')
+            result = finalize_day(conn, day, cutoff)
+            if result:
+                results.append(result)
+        return results
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Finalize past school days: late marks, absentees and daily counts')
+    parser.add_argument('--date', action='append', help='finalize this day (YYYY-MM-DD); repeatable')
+    parser.add_argument('--cutoff', default=LATE_CUTOFF, help='check-ins after this time are late (HH:MM)')
+    parser.add_argument('--tenant', help='school to finalize when TENANT_MODE is set (default: all)')
+    args = parser.parse_args()
+
+    if args.tenant or not app.TENANT_MODE:
+        schools = [args.tenant]
+    else:
+        schools = list_tenants(app.TENANTS_DIR)
+    for school in schools:
+        with use_tenant(school):
+            try:
+                results = finalize(args.date, args.cutoff)
+            except (ValueError, sqlite3.Error) as e:
+                sys.exit(f'finalize failed{f" for {school}" if school else ""}: {e}')
+        for result in results:
+            print(f"{school + ' ' if school else ''}{result['date']}: {result['present']} present, "
+                  f"{result['late']} late, {result['absent']} absent")
+        if not results:
+            print(f"{school + ': ' if school else ''}nothing to finalize")
+
+
+if __name__ == '__main__':
+    main()
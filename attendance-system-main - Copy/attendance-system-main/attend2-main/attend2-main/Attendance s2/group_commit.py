@@ -0,0 +1,120 @@
+"""
+Group commit
+A single writer thread takes write requests from a queue and applies them in
+small batches, one transaction (and one fsync) per batch instead of one per
+request. A batch is closed when it holds `max_batch` requests or `max_delay`
+seconds after its first one arrived, whichever comes first. While one batch
+commits, the next one fills up, so under load batches grow by themselves and
+throughput rises. With max_delay 0 a lone request is written at once; a small
+delay trades that much latency for larger batches.
+
+Each request gets a concurrent.futures.Future that resolves to its own result,
+or to the exception that failed its batch. A failure anywhere in the writer
+fails the batch's futures and the thread goes on with the next batch.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+
+class GroupCommitWriter:
+    """Batches submit(key, item) calls per key and hands each batch to apply(key, items) on one thread
+
+    apply runs on the writer thread and returns one result per item, in order.
+    Items for different keys (databases) go into separate apply calls.
+    """
+
+    def __init__(self, apply, max_batch=64, max_delay=0.0, on_batch=None, on_error=None):
+        self.apply = apply
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        # Called with (key, size, seconds) after each batch, e.g. to record metrics
+        self.on_batch = on_batch
+        # Called with (key or None, exception) when the writer itself fails, e.g. to log it;
+        # the thread keeps running and the batch's unresolved futures get the exception
+        self.on_error = on_error
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _ensure_started(self):
+        # Started on first use, and again in a forked worker (threads do not survive fork)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name='group-commit', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, key, item):
+        """Queue one write; returns a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((key, item, future))
+        return future
+
+    def _collect(self, requests):
+        """Block for one request, then gather more until the batch is full or max_delay has passed"""
+        batch = [requests.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(requests.get(timeout=remaining) if remaining > 0 else requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, requests):
+        while True:
+            batch = self._collect(requests)
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Nothing that goes wrong here may stop the thread or leave a requester waiting forever
+                for _, _, future in batch:
+                    if not future.done():
+                        try:
+                            future.set_exception(e)
+                        except InvalidStateError:
+                            pass  # cancelled meanwhile
+                self._report(None, e)
+
+    def _write(self, batch):
+        by_key = {}
+        for key, item, future in batch:
+            # A requester that gave up (cancelled its future) is not written
+            if future.set_running_or_notify_cancel():
+                by_key.setdefault(key, []).append((item, future))
+        for key, entries in by_key.items():
+            start = time.perf_counter()
+            try:
+                results = list(self.apply(key, [item for item, _ in entries]))
+                if len(results) != len(entries):
+                    raise RuntimeError(f'apply returned {len(results)} results for {len(entries)} items')
+            except Exception as e:
+                for _, future in entries:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(entries, results):
+                    future.set_result(result)
+            if self.on_batch:
+                try:
+                    self.on_batch(key, len(entries), time.perf_counter() - start)
+                except Exception as e:
+                    self._report(key, e)
+
+    def _report(self, key, error):
+        """Hand an error no requester will see to on_error; never raises"""
+        if self.on_error:
+            try:
+                self.on_error(key, error)
+            except Exception:
+                pass
@@ -0,0 +1,172 @@
+"""
+Batch LBPH matching
+A NumPy version of OpenCV's LBPH feature extraction (extended LBP with
+bilinear sampling on a circle, then per-cell normalized histograms) and of its
+chi-square nearest-neighbour search. Histograms come out bit for bit the same as
+the ones cv2.face.LBPHFaceRecognizer stores, so a trained model's gallery
+(getHistograms / getLabels) can be matched against many faces at once. The
+result is one query x gallery distance matrix instead of one predict() call
+per face.
+"""
+
+import math
+
+import numpy as np
+
+# Faces whose LBP codes are computed at once (bounds the float32 temporaries)
+EXTRACT_BATCH = 64
+# Size of each queries x gallery rows x bins temporary of a distance block; small enough to stay in cache
+DISTANCE_BLOCK_BYTES = 256 * 1024
+
+
+def lbp_codes(faces, radius=1, neighbors=8):
+    """Extended LBP code of every interior pixel of an N x H x W uint8 stack, as N x (H-2r) x (W-2r) int32"""
+    src = np.asarray(faces, dtype=np.float32)
+    _, h, w = src.shape
+    center = src[:, radius:h - radius, radius:w - radius]
+    codes = np.zeros(center.shape, np.int32)
+    sample = np.empty(center.shape, np.float32)
+    term = np.empty(center.shape, np.float32)
+    eps = np.finfo(np.float32).eps
+
+    def shifted(dy, dx):
+        return src[:, radius + dy:h - radius + dy, radius + dx:w - radius + dx]
+
+    for n in range(neighbors):
+        # Same float32 sample offsets and bilinear weights as OpenCV's elbp
+        x = np.float32(radius * math.cos(2.0 * math.pi * n / neighbors))
+        y = np.float32(-radius * math.sin(2.0 * math.pi * n / neighbors))
+        fx, fy = int(math.floor(x)), int(math.floor(y))
+        cx, cy = int(math.ceil(x)), int(math.ceil(y))
+        ty, tx = y - np.float32(fy), x - np.float32(fx)
+        weights = (((1 - tx) * (1 - ty), fy, fx), (tx * (1 - ty), fy, cx),
+                   ((1 - tx) * ty, cy, fx), (tx * ty, cy, cx))
+        # Summed in OpenCV's order; terms with a zero weight add exactly nothing and are skipped
+        sample.fill(0)
+        for weight, dy, dx in weights:
+            if weight:
+                np.multiply(shifted(dy, dx), weight, out=term)
+                sample += term
+        above = sample > center
+        np.subtract(sample, center, out=term)
+        np.abs(term, out=term)
+        above |= term < eps
+        codes |= above.astype(np.int32) << n
+    return codes
+
+
+def spatial_histograms(faces, radius=1, neighbors=8, grid_x=8, grid_y=8):
+    """LBPH feature vectors (grid_x * grid_y normalized histograms of 2**neighbors bins) of an N x H x W stack"""
+    patterns = 1 << neighbors
+    cells = grid_x * grid_y
+    out = []
+    for start in range(0, len(faces), EXTRACT_BATCH):
+        codes = lbp_codes(faces[start:start + EXTRACT_BATCH], radius, neighbors)
+        n, h, w = codes.shape
+        # Like OpenCV, cells are H // grid_y x W // grid_x and leftover rows/columns are ignored
+        cell_h, cell_w = h // grid_y, w // grid_x
+        codes = codes[:, :cell_h * grid_y, :cell_w * grid_x]
+        codes = codes.reshape(n, grid_y, cell_h, grid_x, cell_w).transpose(0, 1, 3, 2, 4).reshape(n, cells, -1)
+        # One bincount for the whole block: every (face, cell) pair gets its own run of bins
+        codes = codes + (np.arange(n * cells, dtype=np.int32) * patterns).reshape(n, cells, 1)
+        counts = np.bincount(codes.ravel(), minlength=n * cells * patterns)
+        # OpenCV normalizes by multiplying with the float32 reciprocal of the cell size
+        hist = counts.reshape(n, cells * patterns).astype(np.float32)
+        hist *= np.float32(1.0 / (cell_h * cell_w))
+        out.append(hist)
+    if not out:
+        return np.empty((0, cells * patterns), np.float32)
+    return np.concatenate(out)
+
+
+def chi_square_distances(queries, gallery):
+    """OpenCV HISTCMP_CHISQR_ALT between every query and gallery row: 2 * sum((q - g)^2 / (q + g))
+
+    The gallery may be float16; each block is widened to float32 for the arithmetic.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    count, bins = queries.shape
+    distances = np.empty((count, len(gallery)), np.float32)
+    # A block broadcasts a group of queries against a group of gallery rows. Its queries x rows x bins
+    # temporaries stay near DISTANCE_BLOCK_BYTES: as many queries as fit against one row, then as many
+    # rows as the remaining room allows, so each gallery row is read once per group of queries
+    per_row = max(1, DISTANCE_BLOCK_BYTES // (4 * max(bins, 1)))
+    group = max(1, min(count, per_row))
+    rows = max(1, per_row // group)
+    diff = np.empty((group, min(rows, len(gallery)), bins), np.float32)
+    total = np.empty_like(diff)
+    for first in range(0, count, group):
+        # A tiny offset keeps q + g above zero where both bins are empty; (q - g)^2 then
+        # underflows to 0, so those bins still add nothing, without a masked divide
+        block_queries = queries[first:first + group, None, :] + np.float32(1e-30)
+        n = len(block_queries)
+        for start in range(0, len(gallery), rows):
+            block = gallery[start:start + rows].astype(np.float32, copy=False)
+            d, t = diff[:n, :len(block)], total[:n, :len(block)]
+            np.subtract(block_queries, block, out=d)
+            np.multiply(d, d, out=d)
+            np.add(block_queries, block, out=t)
+            np.divide(d, t, out=d)
+            distances[first:first + n, start:start + len(block)] = d.sum(axis=2)
+    distances *= 2
+    return distances
+
+
+class HistogramMatcher:
+    """A trained LBPH model's gallery as one matrix, for matching several faces per call
+
+    Built from the recognizer with from_recognizer(), as a copy of its histograms
+    (the recognizer keeps its own). With dtype=np.float16 the copy is half the size
+    of a float32 one; distances then differ from OpenCV's in about the third
+    significant digit.
+    """
+
+    def __init__(self, histograms, labels, radius, neighbors, grid_x, grid_y, threshold=float('inf'),
+                 dtype=np.float32):
+        self.histograms = np.ascontiguousarray(histograms, dtype=dtype)
+        self.labels = np.asarray(labels, dtype=np.int32).ravel()
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.threshold = threshold
+
+    @classmethod
+    def from_recognizer(cls, recognizer, dtype=np.float32):
+        histograms = recognizer.getHistograms()
+        return cls(np.concatenate(histograms) if histograms else np.empty((0, 0), np.float32),
+                   recognizer.getLabels(), recognizer.getRadius(), recognizer.getNeighbors(),
+                   recognizer.getGridX(), recognizer.getGridY(), recognizer.getThreshold(), dtype)
+
+    @property
+    def nbytes(self):
+        return self.histograms.nbytes + self.labels.nbytes
+
+    def features(self, faces):
+        """LBPH histograms of preprocessed faces (an N x H x W uint8 stack or a list of equal-sized faces)"""
+        return spatial_histograms(faces, self.radius, self.neighbors, self.grid_x, self.grid_y)
+
+    def distances(self, faces):
+        """Query x gallery chi-square distance matrix"""
+        return chi_square_distances(self.features(faces), self.histograms)
+
+    def predict(self, faces, exclude=()):
+        """(label, distance) of the nearest gallery face for each face, as recognizer.predict() returns it
+
+        Labels in `exclude` (deleted students) are skipped. A face with no match
+        under the threshold gets (-1, inf).
+        """
+        distances = self.distances(faces)
+        if exclude:
+            distances[:, np.isin(self.labels, list(exclude))] = np.inf
+        if not distances.shape[1]:
+            return [(-1, float('inf'))] * len(distances)
+        best = distances.argmin(axis=1)
+        results = []
+        for row, column in enumerate(best):
+            distance = float(distances[row, column])
+            if distance < self.threshold:
+                results.append((int(self.labels[column]), distance))
+            else:
+                results.append((-1, float('inf')))
+        return results
@@ -0,0 +1,396 @@
+"""
+Prometheus-style metrics
+Small in-process counters, gauges and histograms rendered in the Prometheus
+text exposition format, plus a SQLite connection factory that times queries.
+
+Under a pre-forking server each worker counts its own requests. With
+Registry.enable_multiprocess(directory) every process writes its values to
+<directory>/<pid>.json about once a second (and before each scrape it answers),
+and a scrape adds up the files of all processes. Counters and histograms of
+processes that have exited still count; their gauges are dropped. A forked
+child starts from zero, since its parent's file already holds what came before.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self, values=None):
+        """Exposition lines for this process's values, or for `values` merged from several processes"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def snapshot(self):
+        """This process's values as JSON-ready [[label values], value] pairs"""
+        with self._lock:
+            return [[list(key), float(value)] for key, value in self._values.items()]
+
+    def merge(self, snapshots):
+        """Add up (alive, snapshot) pairs from several processes into one {labels: value} dict"""
+        values = {}
+        for _, snapshot in snapshots:
+            for key, value in snapshot:
+                key = tuple(key)
+                values[key] = values.get(key, 0) + value
+        return values
+
+    def reset(self):
+        """Forget every value (in a forked child; the lock may have been held by a parent thread)"""
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _render_sample(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess='sum'):
+        super().__init__(name, documentation, labelnames)
+        # How live processes' values combine: 'sum' (requests in flight) or 'max' (a model version)
+        self.multiprocess = multiprocess
+
+    def merge(self, snapshots):
+        values = {}
+        for alive, snapshot in snapshots:
+            # A process that has exited holds nothing any more
+            if not alive:
+                continue
+            for key, value in snapshot:
+                key = tuple(key)
+                if key not in values:
+                    values[key] = value
+                elif self.multiprocess == 'max':
+                    values[key] = max(values[key], value)
+                else:
+                    values[key] += value
+        return values
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels):
+        """Stop exporting one labelled series (e.g. for a model that was unloaded)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the enclosed block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(state[0]), float(state[1]), state[2]]] for key, state in self._values.items()]
+
+    def merge(self, snapshots):
+        values = {}
+        for _, snapshot in snapshots:
+            for key, (counts, total, count) in snapshot:
+                state = values.setdefault(tuple(key), [[0] * len(self.buckets), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+        return values
+
+    def _render_sample(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self.directory = None
+        self.flush_seconds = 1.0
+        self._flush_lock = threading.Lock()
+        self._written = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        if self.directory:
+            return self._render_all_processes()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def enable_multiprocess(self, directory, flush_seconds=1.0):
+        """Share values between the processes of a pre-forking server through files in `directory`
+
+        Call it once, in the process that forks the workers. Files left by processes that are no
+        longer running (a previous server) are removed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            pid = name.split('.', 1)[0]
+            if name.endswith('.json') and pid.isdigit() and not _process_alive(int(pid)):
+                os.remove(os.path.join(directory, name))
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._start_flusher()
+        if hasattr(os, 'register_at_fork'):
+            # The parent's file is current when a worker forks; the worker then counts from zero
+            os.register_at_fork(before=self._flush_quietly, after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        for metric in self._metrics:
+            metric.reset()
+        self._flush_lock = threading.Lock()
+        self._written = None
+        self._start_flusher()
+
+    def _start_flusher(self):
+        def run():
+            while True:
+                time.sleep(self.flush_seconds)
+                self._flush_quietly()
+
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            pass  # e.g. the directory was removed; the next flush tries again
+
+    def flush(self):
+        """Write this process's values to <directory>/<pid>.json (skipped when nothing changed)"""
+        if not self.directory:
+            return
+        with self._flush_lock:
+            data = json.dumps({metric.name: metric.snapshot() for metric in self._metrics})
+            if data == self._written:
+                return
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            with open(path + '.tmp', 'w') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+            self._written = data
+
+    def _render_all_processes(self):
+        self.flush()
+        processes = []
+        for name in os.listdir(self.directory):
+            pid = name[:-len('.json')]
+            if not (name.endswith('.json') and pid.isdigit()):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    processes.append((_process_alive(int(pid)), json.load(f)))
+            except (FileNotFoundError, ValueError):
+                continue
+        lines = []
+        for metric in self._metrics:
+            snapshots = [(alive, data.get(metric.name, [])) for alive, data in processes]
+            lines.extend(metric.render(metric.merge(snapshots)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'attendance_http_request_duration_seconds', 'HTTP request latency by route',
+    ['route', 'method', 'status']))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    'attendance_recognition_stage_duration_seconds', 'Time spent in each face recognition stage',
+    ['stage']))
+FACE_DETECTIONS = REGISTRY.register(Counter(
+    'attendance_face_detection_total', 'Face detection attempts by outcome (hit, miss, or client for browser-cropped faces)',
+    ['result']))
+FRAME_TRIAGE = REGISTRY.register(Counter(
+    'attendance_frame_triage_total', 'Frames by triage outcome (ok or the rejection reason code)',
+    ['reason']))
+RECOGNITION_CONFIDENCE = REGISTRY.register(Histogram(
+    'attendance_recognition_confidence', 'LBPH distance returned by predict (lower is a closer match)',
+    buckets=(10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 150, 200, 300, 500)))
+MODEL_VERSION = REGISTRY.register(Gauge(
+    'attendance_model_version',
+    'Newest generation of each loaded recognizer model (bumped on every publish); tenant is empty for a single school',
+    ['tenant'], multiprocess='max'))
+MODEL_FACES = REGISTRY.register(Gauge(
+    'attendance_model_faces', 'Faces (histograms) held by each loaded recognizer', ['tenant'], multiprocess='max'))
+MODEL_BYTES = REGISTRY.register(Gauge(
+    'attendance_model_bytes', 'Approximate memory used by the histograms of all loaded recognizers, in all processes'))
+MODEL_CACHE_MODELS = REGISTRY.register(Gauge(
+    'attendance_model_cache_models', 'Recognizer models currently loaded, added up over the server processes'))
+MODEL_CACHE_EVICTIONS = REGISTRY.register(Counter(
+    'attendance_model_cache_evictions_total', 'Recognizer models unloaded, by reason (budget or idle)',
+    ['reason']))
+RECOGNITION_IN_FLIGHT = REGISTRY.register(Gauge(
+    'attendance_recognition_in_flight', 'Recognition requests holding a slot'))
+RECOGNITION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'attendance_recognition_queue_depth', 'Recognition requests waiting for a slot'))
+RECOGNITION_QUEUE_WAIT = REGISTRY.register(Histogram(
+    'attendance_recognition_queue_wait_seconds', 'Time admitted recognition requests waited for a slot',
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)))
+RECOGNITION_ADMISSION = REGISTRY.register(Counter(
+    'attendance_recognition_admission_total',
+    'Recognition requests by admission outcome (admitted, or shed as queue_full / timeout)',
+    ['result']))
+MARK_WRITE_BATCH = REGISTRY.register(Histogram(
+    'attendance_mark_write_batch_size', 'Attendance marks committed per group-commit transaction',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)))
+SNAPSHOT_REFRESH = REGISTRY.register(Histogram(
+    'attendance_snapshot_refresh_seconds', 'Time to copy the database into the read snapshot used by heavy reports',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)))
+PAGE_CACHE = REGISTRY.register(Counter(
+    'attendance_page_cache_total',
+    'Cacheable page requests by outcome (not_modified, or fragment_hit / fragment_miss when rendered)',
+    ['page', 'result']))
+SQLITE_QUERY_LATENCY = REGISTRY.register(Histogram(
+    'attendance_sqlite_query_duration_seconds', 'SQLite statement execution time by statement type',
+    ['statement'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)))
+
+
+def _statement_type(sql):
+    words = sql.split(None, 1)
+    return words[0].upper() if words else 'EMPTY'
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records statement execution time"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            SQLITE_QUERY_LATENCY.observe(time.perf_counter() - start, statement=_statement_type(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            SQLITE_QUERY_LATENCY.observe(time.perf_counter() - start, statement=_statement_type(sql))
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (and shortcut execute methods) are timed"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,74 @@
+"""
+Page cache
+Per-table version counters that SQLite triggers bump on every write, and a
+small LRU of rendered HTML fragments keyed by those versions. A page that
+reads only unchanged tables can be answered with a 304 or from a cached
+fragment instead of querying and re-rendering.
+"""
+
+import threading
+from collections import OrderedDict
+
+VERSIONED_TABLES = ('students', 'users', 'attendance', 'verification_requests')
+
+
+def create_version_tracking(cursor):
+    """Create the table_versions table and the triggers that keep it current (idempotent)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+    cursor.executemany('INSERT OR IGNORE INTO table_versions (name) VALUES (?)',
+                       [(table,) for table in VERSIONED_TABLES])
+    for table in VERSIONED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE table_versions
+                    SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE name = '{table}';
+                END
+            ''')
+
+
+def read_versions(cursor, tables):
+    """{table: (version, updated_at unix seconds)} for the given tables"""
+    placeholders = ','.join('?' * len(tables))
+    cursor.execute(f'SELECT name, version, updated_at FROM table_versions WHERE name IN ({placeholders})',
+                   tuple(tables))
+    return {name: (version, updated_at) for name, version, updated_at in cursor.fetchall()}
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments; keys must include the versions they were built from"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
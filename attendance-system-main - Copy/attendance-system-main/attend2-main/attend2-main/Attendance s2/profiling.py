@@ -0,0 +1,215 @@
+"""
+Request profiling
+Profiles live requests with cProfile (and optionally tracemalloc) while an
+admin has it switched on. Either a sampled fraction of requests is profiled,
+or requests that send the X-Profile header. Each profile is saved as a .prof
+file, which pstats, snakeviz and similar tools can open, next to a .json file
+with the route, timings and the top functions and allocations.
+
+The switch is a small settings file in the profile directory, so every
+server process sees it. A process re-reads it at most once a second. While
+it is off, a request costs one clock read and a comparison.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import secrets
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+PROFILE_HEADER = 'X-Profile'
+SETTINGS_NAME = 'settings.json'
+PROFILE_ID = re.compile(r'^\d{8}T\d{6}-\d{6}-[0-9a-f]{6}$')
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+
+
+class RequestProfiler:
+    """Decides which requests to profile, profiles one at a time and keeps the newest `keep` profiles"""
+
+    def __init__(self, directory, keep=200, check_interval=1.0):
+        self.directory = directory
+        self.keep = keep
+        self.check_interval = check_interval
+        self._settings = None
+        self._settings_mtime = None
+        self._next_check = 0.0
+        # cProfile (sys.monitoring since Python 3.12) and tracemalloc are process-wide,
+        # so only one request is profiled at a time; others run unprofiled meanwhile
+        self._busy = threading.Lock()
+
+    def settings_path(self):
+        return os.path.join(self.directory, SETTINGS_NAME)
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.settings_path()).st_mtime_ns
+        except FileNotFoundError:
+            self._settings, self._settings_mtime = None, None
+            return
+        if mtime != self._settings_mtime:
+            try:
+                with open(self.settings_path()) as f:
+                    self._settings = json.load(f)
+            except (OSError, ValueError):
+                self._settings = None
+            self._settings_mtime = mtime
+
+    def settings(self):
+        """Current switch settings, or None when profiling is off"""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._reload()
+        settings = self._settings
+        if settings is None or settings['until'] < time.time():
+            return None
+        return settings
+
+    def configure(self, sample_rate=0.0, header=True, memory=False, minutes=15):
+        """Switch profiling on for `minutes` (0 switches it off); returns the stored settings"""
+        os.makedirs(self.directory, exist_ok=True)
+        settings = {
+            'sample_rate': min(max(float(sample_rate), 0.0), 1.0),
+            'header': bool(header),
+            'memory': bool(memory),
+            'until': time.time() + max(float(minutes), 0.0) * 60,
+        }
+        tmp_path = f'{self.settings_path()}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(settings, f)
+        os.replace(tmp_path, self.settings_path())
+        self._next_check = 0.0
+        return settings
+
+    def trigger(self, headers):
+        """'header' or 'sample' when this request should be profiled, else None"""
+        settings = self.settings()
+        if settings is None:
+            return None
+        if settings['header'] and headers.get(PROFILE_HEADER):
+            return 'header'
+        if settings['sample_rate'] and random.random() < settings['sample_rate']:
+            return 'sample'
+        return None
+
+    def start(self, trigger):
+        """Begin profiling the calling thread; returns a handle for finish(), or None if another profile is running"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        settings = self.settings() or {}
+        memory = settings.get('memory', False) and not tracemalloc.is_tracing()
+        if memory:
+            tracemalloc.start()
+        profile = cProfile.Profile()
+        handle = {
+            'trigger': trigger,
+            'memory': memory,
+            'profile': profile,
+            'wall': time.perf_counter(),
+            'cpu': time.thread_time(),
+        }
+        profile.enable()
+        return handle
+
+    def finish(self, handle, **meta):
+        """Stop profiling and save the profile with `meta` (route, status, ...); returns the profile id"""
+        profile = handle['profile']
+        profile.disable()
+        try:
+            duration = time.perf_counter() - handle['wall']
+            cpu = time.thread_time() - handle['cpu']
+            allocations = None
+            if handle['memory']:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                allocations = {
+                    'peak_bytes': peak,
+                    'retained_bytes': current,
+                    'top': [
+                        {'where': str(stat.traceback[0]), 'bytes': stat.size, 'count': stat.count}
+                        for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+                    ],
+                }
+        finally:
+            self._busy.release()
+
+        now = datetime.now(timezone.utc)
+        profile_id = f"{now.strftime('%Y%m%dT%H%M%S-%f')}-{secrets.token_hex(3)}"
+        record = {
+            'id': profile_id,
+            'created_at': now.isoformat(timespec='seconds'),
+            'trigger': handle['trigger'],
+            'duration_ms': round(duration * 1000, 2),
+            'cpu_ms': round(cpu * 1000, 2),
+            **meta,
+            'top_functions': top_functions(profile),
+            'memory': allocations,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(os.path.join(self.directory, profile_id + '.prof'))
+        with open(os.path.join(self.directory, profile_id + '.json'), 'w') as f:
+            json.dump(record, f, indent=1)
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        for profile_id in self.ids()[self.keep:]:
+            for ext in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + ext))
+                except FileNotFoundError:
+                    pass
+
+    def ids(self):
+        """Saved profile ids, newest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-5] for name in names if name.endswith('.json') and PROFILE_ID.match(name[:-5])),
+                      reverse=True)
+
+    def load(self, profile_id):
+        """The saved metadata of one profile, or None"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, profile_id + '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def report(self, profile_id, sort='cumulative', limit=60):
+        """pstats text report of one profile, or None"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + '.prof')
+        if not os.path.exists(path):
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+def top_functions(profile, limit=TOP_FUNCTIONS):
+    """The most expensive functions by cumulative time, as JSON-friendly rows"""
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f'{os.path.basename(filename)}:{line}({name})',
+            'calls': calls,
+            'total_ms': round(total * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data Seeder
+Fills fresh databases with N students (with generated faces), T teachers
+and D days of attendance history, then times the dashboard, report,
+student-detail and teacher routes so we can see how they degrade with scale.
+
+Usage:
+    python seed_data.py --students 1000 --teachers 20 --days 60
+    python seed_data.py --students 100 1000 10000 --days 120 --db-dir seeded --output scale.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import bcrypt
+import numpy as np
+
+import app
+from benchmark import summarize
+from synthetic_faces import enrollment_face
+
+SEED_TEACHER_PASSWORD = 'teacher123'
+
+
+def school_days(days, end):
+    """The last `days` weekdays up to and including `end`"""
+    result = []
+    current = end
+    while len(result) < days:
+        if current.weekday() < 5:
+            result.append(current)
+        current -= timedelta(days=1)
+    return sorted(result)
+
+
+def seed_students(conn, count, face_variety):
+    """Bulk insert students; faces cycle through `face_variety` distinct identities"""
+    distinct = app.preprocess_faces([enrollment_face(i) for i in range(min(count, face_variety))])
+    store = app.get_face_store()
+    slots = []
+    # Write the face store in chunks so huge galleries never sit in memory at once
+    for first in range(0, count, 4096):
+        index = np.arange(first, min(first + 4096, count)) % len(distinct)
+        slots.extend(store.extend(distinct[index]))
+    rows = ((f'Student {i:06d}', f'S{i:06d}', f'student{i}@school.test', slot) for i, slot in enumerate(slots))
+    conn.executemany('INSERT INTO students (name, student_id, email, face_slot) VALUES (?, ?, ?, ?)', rows)
+    return [row[0] for row in conn.execute('SELECT id FROM students ORDER BY id')]
+
+
+def seed_teachers(conn, count, rng):
+    """Bulk insert teachers (mostly verified) plus pending verification requests for the rest"""
+    # Hash once: bcrypt is deliberately slow and every seeded teacher shares a password
+    password_hash = bcrypt.hashpw(SEED_TEACHER_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    verified = rng.random(count) < 0.9
+    conn.executemany('''
+        INSERT INTO users (username, email, password_hash, role, is_verified)
+        VALUES (?, ?, ?, 'teacher', ?)
+    ''', ((f'teacher{i:04d}', f'teacher{i:04d}@school.test', password_hash, bool(verified[i]))
+          for i in range(count)))
+    teacher_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'teacher' ORDER BY id")]
+    conn.executemany('INSERT INTO verification_requests (user_id, token) VALUES (?, ?)',
+                     ((tid, f'seed-token-{tid}') for tid, ok in zip(teacher_ids, verified) if not ok))
+    return [tid for tid, ok in zip(teacher_ids, verified) if ok] or teacher_ids
+
+
+def seed_attendance(conn, student_ids, teacher_ids, days, presence, late_rate, cutoff, rng):
+    """Bulk insert D days of marks with per-student attendance propensity and arrival-time spread"""
+    n = len(student_ids)
+    # Each student has their own attendance habit centred on `presence`
+    concentration = 20.0
+    propensity = rng.beta(presence * concentration, (1 - presence) * concentration, n)
+    # Habitually late students arrive later on average
+    lateness = rng.beta(late_rate * concentration, (1 - late_rate) * concentration, n)
+    cutoff_minutes = cutoff.hour * 60 + cutoff.minute
+    ids = np.asarray(student_ids)
+    teachers = np.asarray(teacher_ids) if teacher_ids else np.asarray([None])
+    total = 0
+
+    for day in days:
+        present = rng.random(n) < propensity
+        late = rng.random(n) < lateness
+        on_time_minutes = cutoff_minutes - rng.gamma(2.0, 8.0, n)
+        late_minutes = cutoff_minutes + 1 + rng.exponential(12.0, n)
+        minutes = np.where(late, late_minutes, on_time_minutes)
+        seconds = rng.integers(0, 60, n)
+        markers = rng.choice(teachers, n)
+        day_iso = day.isoformat()
+
+        rows = []
+        for k in np.flatnonzero(present):
+            m = int(minutes[k])
+            rows.append((int(ids[k]), day_iso, f'{m // 60:02d}:{m % 60:02d}:{int(seconds[k]):02d}',
+                         'late' if late[k] else 'present',
+                         None if markers[k] is None else int(markers[k])))
+        conn.executemany('''
+            INSERT INTO attendance (student_id, date, time, status, marked_by)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        total += len(rows)
+    return total
+
+
+def seed_database(path, students, teachers, days, presence, late_rate, cutoff, face_variety, seed):
+    """Create and fill a fresh database at `path`; returns counts and timings"""
+    if os.path.exists(path):
+        raise SystemExit(f'{path} already exists; seeding only writes fresh databases')
+    faces_path = os.path.splitext(path)[0] + '.faces'
+    if os.path.exists(faces_path):
+        os.remove(faces_path)
+    rng = np.random.default_rng(seed)
+    app.DATABASE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.init_db()
+
+    start = time.perf_counter()
+    conn = app.get_db()
+    # Seeding is a one-off bulk load, so trade durability for speed
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    with conn:
+        student_ids = seed_students(conn, students, face_variety)
+        teacher_ids = seed_teachers(conn, teachers, rng)
+        day_list = school_days(days, date.today())
+        marks = seed_attendance(conn, student_ids, teacher_ids, day_list, presence, late_rate, cutoff, rng)
+    conn.close()
+
+    return {
+        'students': len(student_ids),
+        'teachers': teachers,
+        'days': len(day_list),
+        'attendance_rows': marks,
+        'seed_seconds': round(time.perf_counter() - start, 3),
+        'db_bytes': os.path.getsize(path),
+    }, student_ids, teacher_ids
+
+
+def time_routes(student_ids, teacher_ids, iterations, rng):
+    """Time the heavy read routes through the Flask test client"""
+    client = app.app.test_client()
+    samples = {}
+
+    def timed(label, path, role, user_id):
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = role
+            sess['role'] = role
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.setdefault(label, []).append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} returned {response.status_code}')
+
+    admin_id = app.get_db().execute("SELECT id FROM users WHERE role = 'admin'").fetchone()[0]
+    teacher_id = teacher_ids[0] if teacher_ids else admin_id
+    for _ in range(iterations):
+        timed('admin_dashboard', '/admin/dashboard', 'admin', admin_id)
+        timed('teachers', '/teachers', 'admin', admin_id)
+        timed('students', '/students', 'admin', admin_id)
+        timed('daily_attendance_report', '/daily_attendance_report', 'admin', admin_id)
+        timed('api_get_student', f'/api/students/{int(rng.choice(student_ids))}', 'admin', admin_id)
+        timed('teacher_dashboard', '/teacher/dashboard', 'teacher', teacher_id)
+        timed('api_teacher_attendance_data', '/api/teacher/attendance-data', 'teacher', teacher_id)
+    return {label: summarize(values) for label, values in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed synthetic attendance data and time the read routes')
+    parser.add_argument('--students', type=int, nargs='+', default=[1000],
+                        help='student counts; one fresh database is built per value')
+    parser.add_argument('--teachers', type=int, default=20)
+    parser.add_argument('--days', type=int, default=60, help='school days of history, ending today')
+    parser.add_argument('--presence', type=float, default=0.92, help='mean daily attendance rate')
+    parser.add_argument('--late-rate', type=float, default=0.08, help='mean share of marks after the cutoff')
+    parser.add_argument('--cutoff', default='08:15', help='lateness cutoff (HH:MM)')
+    parser.add_argument('--face-variety', type=int, default=500,
+                        help='distinct synthetic faces to generate; blobs are reused beyond this')
+    parser.add_argument('--iterations', type=int, default=20, help='timed requests per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-dir', help='keep seeded databases in this directory (default: temporary)')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    cutoff = datetime.strptime(args.cutoff, '%H:%M').time()
+    db_dir = args.db_dir or tempfile.mkdtemp(prefix='attendance-seed-')
+    os.makedirs(db_dir, exist_ok=True)
+    previous_db = app.DATABASE
+    results = []
+    try:
+        for count in args.students:
+            path = os.path.join(db_dir, f'seed_{count}s_{args.teachers}t_{args.days}d.db')
+            print(f"[{count}] seeding {path} ...", file=sys.stderr)
+            info, student_ids, teacher_ids = seed_database(
+                path, count, args.teachers, args.days, args.presence, args.late_rate, cutoff,
+                args.face_variety, args.seed)
+            print(f"[{count}] {info['attendance_rows']} marks in {info['seed_seconds']}s; timing routes ...",
+                  file=sys.stderr)
+            routes = time_routes(student_ids, teacher_ids, args.iterations, np.random.default_rng(args.seed))
+            results.append({'database': path if args.db_dir else None, **info, 'routes': routes})
+            for label, stats in routes.items():
+                print(f"  {label:<30}p50 {stats['p50']:>9.3f}  p95 {stats['p95']:>9.3f}  p99 {stats['p99']:>9.3f} ms",
+                      file=sys.stderr)
+    finally:
+        app.DATABASE = previous_db
+        if not args.db_dir:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    payload = json.dumps({
+        'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'), 'units': 'milliseconds',
+                 'args': vars(args)},
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(payload + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Production Server
+Runs the app under gunicorn (pre-forked workers, Linux/macOS) or waitress
+(threads only, any platform) instead of the Flask development server.
+
+The app is warmed up once, in the parent, before gunicorn forks its workers:
+the database is initialised, the published model loaded (or trained, if none
+was ever published) and a synthetic frame run through detection and
+prediction. Every worker starts with the same warm model shared copy-on-write.
+After that no worker trains on its own: the process that handles an enrollment
+or a compaction retrains and publishes the model, and the other workers load it
+on their next recognition when they see the version file change.
+
+With TENANT_MODE set, each school's database is initialised here and the
+models of the WARM_UP_TENANTS most recently active schools are loaded; workers
+load any other school's model on its first recognition and keep at most
+MODEL_CACHE_BYTES of them.
+
+Each worker counts its own metrics; under gunicorn they are shared through
+files in METRICS_DIR (a temporary directory unless set), so /metrics on any
+worker reports all of them.
+
+Usage:
+    python serve.py                                   # gunicorn if installed, else waitress
+    python serve.py --workers 4 --threads 4 --bind 0.0.0.0:5000
+    python serve.py --server waitress --threads 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import app as attendance
+
+
+def prepare():
+    """One-time startup in the parent process: schema, migrations, the model and a warm-up frame"""
+    attendance.warm_up()
+    return attendance.app
+
+
+def run_gunicorn(bind, workers, threads, timeout):
+    from gunicorn.app.base import BaseApplication
+
+    if not attendance.METRICS_DIR:
+        # Without shared files each /metrics scrape would only see the worker that answered it
+        attendance.REGISTRY.enable_multiprocess(tempfile.mkdtemp(prefix='attendance-metrics-'))
+
+    class Server(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # With preload_app this runs in the master, before the workers are forked
+            return prepare()
+
+    Server({
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        # Enrollment retrains in the request, which can take a while for a big gallery
+        'timeout': timeout,
+        # Kiosks keep their connection (and so their live stream's worker) between frames
+        'keepalive': 5,
+    }).run()
+
+
+def run_waitress(bind, threads):
+    from waitress import serve
+    serve(prepare(), listen=bind, threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the attendance system with a production WSGI server')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress'], default=os.getenv('WEB_SERVER', 'auto'))
+    parser.add_argument('--bind', default=os.getenv('WEB_BIND', '0.0.0.0:5000'), help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', str(os.cpu_count() or 1))),
+                        help='worker processes (gunicorn only)')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', '4')),
+                        help='request threads per worker')
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('WEB_TIMEOUT', '120')),
+                        help='seconds before a silent gunicorn worker is restarted')
+    args = parser.parse_args()
+
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn'
+        except ImportError:
+            server = 'waitress'
+
+    if server == 'gunicorn':
+        try:
+            run_gunicorn(args.bind, args.workers, args.threads, args.timeout)
+        except ImportError:
+            sys.exit('gunicorn is not installed (it does not run on Windows; use --server waitress)')
+    else:
+        try:
+            run_waitress(args.bind, args.threads)
+        except ImportError:
+            sys.exit('waitress is not installed: pip install waitress')
+
+
+if __name__ == '__main__':
+    main()
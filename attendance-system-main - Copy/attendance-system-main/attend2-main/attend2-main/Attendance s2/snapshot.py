@@ -0,0 +1,160 @@
+"""
+Read snapshots
+Heavy reads (attendance history) run against a read-only copy of the database
+instead of the live file. The copy is made with SQLite's online backup API, a
+few pages per step with a pause in between: the source is read-locked only
+while one step copies, so attendance writes get the database between steps.
+The finished copy is renamed into place. A reader opens it as immutable, so
+it takes no locks at all and never stands in the way of attendance writes.
+
+A snapshot is refreshed when a read finds it older than `max_age` seconds and
+the source has changed since it was taken, so an idle database is not copied
+over and over. The snapshot's modification time is set to the moment the copy
+started, which makes it the age of the data it holds.
+
+SQLite starts a stepped copy over when another connection writes between two
+steps. After `max_restarts` of those the refresh gives up; the reader then
+gets the previous snapshot, however old, or the live database if there is
+none, rather than making writers wait.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+SNAPSHOT_SUFFIX = '.snapshot'
+
+
+class SnapshotBusy(Exception):
+    """A refresh kept being restarted by writes to the source and gave up"""
+
+
+def snapshot_path(source):
+    """Where the snapshot of `source` is kept: next to it, with a .snapshot suffix"""
+    return source + SNAPSHOT_SUFFIX
+
+
+def source_uri(path, immutable=False):
+    uri = f'file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro'
+    return uri + '&immutable=1' if immutable else uri
+
+
+def source_mtime(source):
+    """Last change to the database: the file itself, or its -wal file in WAL mode"""
+    mtime = os.stat(source).st_mtime
+    try:
+        mtime = max(mtime, os.stat(source + '-wal').st_mtime)
+    except FileNotFoundError:
+        pass
+    return mtime
+
+
+class SnapshotReader:
+    """Read-only connections to snapshots of SQLite databases that are at most `max_age` seconds behind
+
+    Each refresh copies `step_pages` pages per step and sleeps `step_pause` seconds between steps.
+    """
+
+    def __init__(self, max_age, step_pages=1024, step_pause=0.01, max_restarts=3, on_refresh=None, on_busy=None):
+        self.max_age = max_age
+        self.step_pages = max(1, step_pages)
+        self.step_pause = step_pause
+        self.max_restarts = max_restarts
+        # Called with (source, seconds, bytes) after each refresh, e.g. to record metrics
+        self.on_refresh = on_refresh
+        # Called with (source, SnapshotBusy) when a refresh gives up
+        self.on_busy = on_busy
+        self._lock = threading.Lock()
+        self._refreshing = {}
+
+    def taken_at(self, source):
+        """When the current snapshot of `source` was taken (epoch seconds), or None if it has none"""
+        try:
+            return os.stat(snapshot_path(source)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def is_fresh(self, source):
+        taken = self.taken_at(source)
+        if taken is None:
+            return False
+        return time.time() - taken <= self.max_age or source_mtime(source) < taken
+
+    def refresh(self, source):
+        """Copy `source` to its snapshot with the online backup API; returns the time the copy started"""
+        target = snapshot_path(source)
+        tmp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        timer = time.perf_counter()
+        # When the pass that ends up in the snapshot started reading the source
+        start = step_start = time.time()
+        restarts = 0
+        remaining_before = None
+
+        def between_steps(status, remaining, total):
+            nonlocal start, step_start, restarts, remaining_before
+            # A write between steps makes SQLite start the copy over in this step, so a step that
+            # copied pages (status OK, not BUSY/LOCKED) without bringing remaining down restarted
+            if status == sqlite3.SQLITE_OK and remaining_before is not None and remaining >= remaining_before:
+                restarts += 1
+                if restarts > self.max_restarts:
+                    raise SnapshotBusy(f'{source} changed during {restarts} snapshot copies')
+                start = step_start
+            remaining_before = remaining
+            if remaining:
+                time.sleep(self.step_pause)
+            step_start = time.time()
+
+        try:
+            src = sqlite3.connect(source_uri(source), uri=True)
+            try:
+                dst = sqlite3.connect(tmp_path)
+                try:
+                    src.backup(dst, pages=self.step_pages, progress=between_steps, sleep=self.step_pause)
+                finally:
+                    dst.close()
+            finally:
+                src.close()
+            # The snapshot's age is the age of its data, not of the file
+            os.utime(tmp_path, (start, start))
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        if self.on_refresh:
+            self.on_refresh(source, time.perf_counter() - timer, os.path.getsize(target))
+        return start
+
+    def ensure_fresh(self, source):
+        """Refresh the snapshot of `source` unless it is within the freshness bound; returns when it was taken"""
+        if self.is_fresh(source):
+            return self.taken_at(source)
+        # One refresh per database at a time in this process; the others wait for it and reuse it
+        with self._lock:
+            lock = self._refreshing.setdefault(source, threading.Lock())
+        with lock:
+            if self.is_fresh(source):
+                return self.taken_at(source)
+            return self.refresh(source)
+
+    def connect(self, source, **kwargs):
+        """Read-only connection to a fresh-enough snapshot of `source`; returns (connection, taken at)
+
+        The connection keeps reading the snapshot it opened even if a newer one
+        replaces it meanwhile. When a refresh gives up (SnapshotBusy) the previous
+        snapshot is used, or the live database read-only if there is none, with
+        "taken at" then being now. Keyword arguments go to sqlite3.connect.
+        """
+        try:
+            taken = self.ensure_fresh(source)
+        except SnapshotBusy as e:
+            if self.on_busy:
+                self.on_busy(source, e)
+            taken = self.taken_at(source)
+            if taken is None:
+                return sqlite3.connect(source_uri(source), uri=True, **kwargs), time.time()
+        return sqlite3.connect(source_uri(snapshot_path(source), immutable=True), uri=True, **kwargs), taken
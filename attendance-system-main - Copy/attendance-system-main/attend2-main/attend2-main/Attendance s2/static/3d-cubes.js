@@ -126,10 +126,16 @@ class FloatingCubes {
     }
 }
 
-// Initialize when DOM is loaded
-document.addEventListener('DOMContentLoaded', function() {
+// Initialize when DOM is loaded (right away if the script was loaded on demand)
+function initCubes() {
     const canvas = document.getElementById('cubes-canvas');
     if (canvas) {
         new FloatingCubes(canvas);
     }
-});
\ No newline at end of file
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initCubes);
+} else {
+    initCubes();
+}
\ No newline at end of file
@@ -206,10 +206,16 @@ class DNAHelix {
     }
 }
 
-// Initialize when DOM is loaded
-document.addEventListener('DOMContentLoaded', function() {
+// Initialize when DOM is loaded (right away if the script was loaded on demand)
+function initDNA() {
     const canvas = document.getElementById('dna-canvas');
     if (canvas) {
         new DNAHelix(canvas);
     }
-});
\ No newline at end of file
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initDNA);
+} else {
+    initDNA();
+}
\ No newline at end of file
@@ -215,10 +215,16 @@ class GeometricShapes3D {
     }
 }
 
-// Initialize when DOM is loaded
-document.addEventListener('DOMContentLoaded', function() {
+// Initialize when DOM is loaded (right away if the script was loaded on demand)
+function initGeometry() {
     const canvas = document.getElementById('geometry-canvas');
     if (canvas) {
         new GeometricShapes3D(canvas);
     }
-});
\ No newline at end of file
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initGeometry);
+} else {
+    initGeometry();
+}
\ No newline at end of file
@@ -206,10 +206,16 @@ class SphereNetwork {
     }
 }
 
-// Initialize when DOM is loaded
-document.addEventListener('DOMContentLoaded', function() {
+// Initialize when DOM is loaded (right away if the script was loaded on demand)
+function initSpheres() {
     const canvas = document.getElementById('spheres-canvas');
     if (canvas) {
         new SphereNetwork(canvas);
     }
-});
\ No newline at end of file
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initSpheres);
+} else {
+    initSpheres();
+}
\ No newline at end of file
@@ -149,10 +149,16 @@ class Wave3D {
     }
 }
 
-// Initialize when DOM is loaded
-document.addEventListener('DOMContentLoaded', function() {
+// Initialize when DOM is loaded (right away if the script was loaded on demand)
+function initWaves() {
     const canvas = document.getElementById('waves-canvas');
     if (canvas) {
         new Wave3D(canvas);
     }
-});
\ No newline at end of file
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initWaves);
+} else {
+    initWaves();
+}
\ No newline at end of file
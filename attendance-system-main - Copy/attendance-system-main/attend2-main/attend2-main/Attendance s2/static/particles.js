@@ -95,10 +95,16 @@ class ParticleSystem {
     }
 }
 
-// Initialize particles when DOM is loaded
-document.addEventListener('DOMContentLoaded', function() {
+// Initialize particles when DOM is loaded (right away if the script was loaded on demand)
+function initParticles() {
     const canvas = document.getElementById('particles-canvas');
     if (canvas) {
         new ParticleSystem(canvas);
     }
-});
\ No newline at end of file
+}
+
+if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', initParticles);
+} else {
+    initParticles();
+}
\ No newline at end of file
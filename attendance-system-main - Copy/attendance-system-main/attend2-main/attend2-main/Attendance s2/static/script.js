@@ -185,7 +185,7 @@ async function submitAttendance(imageData) {
     isProcessing = true;
     
     try {
-        const response = await fetch('/mark_attendance', {
+        const response = await fetch(window.APP_ROOT + '/mark_attendance', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -579,7 +579,8 @@ function initializeDashboard() {
 
 // Initialize page-specific functionality
 function initializePage() {
-    const currentPage = window.location.pathname;
+    // Page paths without the /<school> prefix of multi-school deployments
+    const currentPage = window.location.pathname.slice(window.APP_ROOT.length);
     
     switch (currentPage) {
         case '/mark_attendance':
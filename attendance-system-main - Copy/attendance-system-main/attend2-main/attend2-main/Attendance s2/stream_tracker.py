@@ -0,0 +1,155 @@
+"""
+Stream tracker
+Detect-then-track state for one live kiosk stream. Faces are detected every Nth
+frame; in between, each box is followed by template matching on a small
+downscaled patch. Identification runs only until a track's identity is stable,
+so a face standing in front of the camera costs a few predictions in total
+rather than one per frame.
+"""
+
+import itertools
+
+import cv2
+import numpy as np
+
+# Tracking templates are resized so the face is about this many pixels wide
+TEMPLATE_SIZE = 32
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = tuple(int(v) for v in box)
+        self.template = None
+        self.scale = 1.0
+        self.misses = 0
+        self.votes = []
+        self.label = None
+        self.confidence = None
+        self.stable = False
+        self.gave_up = False
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'box': list(self.box),
+            'label': self.label if self.stable else None,
+            'stable': self.stable,
+        }
+
+
+class StreamTracker:
+    """
+    Per-connection tracker.
+
+    `detect(gray)` returns face boxes (x, y, w, h); `identify(face_gray)` takes a
+    128x128 crop and returns (label, distance) or None when the match is rejected.
+    """
+
+    def __init__(self, detect, identify, detect_every=5, stable_votes=3, max_predictions=8,
+                 max_misses=2, min_match=0.5):
+        self.detect = detect
+        self.identify = identify
+        self.detect_every = max(1, int(detect_every))
+        self.stable_votes = max(1, int(stable_votes))
+        self.max_predictions = max(self.stable_votes, int(max_predictions))
+        self.max_misses = max_misses
+        self.min_match = min_match
+        self.frames = 0
+        self.tracks = []
+        self.counts = {'detect': 0, 'track': 0, 'predict': 0}
+        self._ids = itertools.count(1)
+
+    def process(self, gray):
+        """Advance one grayscale frame; returns the tracks whose identity became stable on it"""
+        if self.frames % self.detect_every == 0 or not self.tracks:
+            self._detect(gray)
+        else:
+            self._track(gray)
+        self.frames += 1
+        return self._identify(gray)
+
+    def _remember(self, track, gray):
+        x, y, w, h = track.box
+        track.scale = TEMPLATE_SIZE / max(w, 1)
+        patch = gray[y:y+h, x:x+w]
+        track.template = cv2.resize(patch, (TEMPLATE_SIZE, max(1, round(h * track.scale))),
+                                    interpolation=cv2.INTER_AREA)
+
+    def _detect(self, gray):
+        self.counts['detect'] += 1
+        boxes = [tuple(int(v) for v in box) for box in self.detect(gray)]
+        unmatched = list(self.tracks)
+        for box in boxes:
+            match = max(unmatched, key=lambda t: _iou(t.box, box), default=None)
+            if match is not None and _iou(match.box, box) > 0.3:
+                unmatched.remove(match)
+                match.box = box
+                match.misses = 0
+            else:
+                match = Track(next(self._ids), box)
+                self.tracks.append(match)
+            self._remember(match, gray)
+        for track in unmatched:
+            track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+    def _track(self, gray):
+        height, width = gray.shape[:2]
+        for track in self.tracks:
+            if track.template is None:
+                continue
+            self.counts['track'] += 1
+            x, y, w, h = track.box
+            # Search a window half a face wider on every side, at template scale
+            mx, my = w // 2, h // 2
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            x1, y1 = min(width, x + w + mx), min(height, y + h + my)
+            window = cv2.resize(gray[y0:y1, x0:x1],
+                                (max(1, round((x1 - x0) * track.scale)), max(1, round((y1 - y0) * track.scale))),
+                                interpolation=cv2.INTER_AREA)
+            th, tw = track.template.shape
+            if window.shape[0] < th or window.shape[1] < tw:
+                track.misses += 1
+                continue
+            scores = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+            _, best, _, (bx, by) = cv2.minMaxLoc(scores)
+            if best < self.min_match:
+                track.misses += 1
+                continue
+            track.box = (x0 + round(bx / track.scale), y0 + round(by / track.scale), w, h)
+            track.misses = 0
+            self._remember(track, gray)
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+    def _identify(self, gray):
+        stabilized = []
+        for track in self.tracks:
+            if track.stable or track.gave_up or track.misses:
+                continue
+            x, y, w, h = track.box
+            face = cv2.resize(gray[y:y+h, x:x+w], (128, 128))
+            self.counts['predict'] += 1
+            result = self.identify(face)
+            track.votes.append(result)
+            recent = track.votes[-self.stable_votes:]
+            if (len(recent) == self.stable_votes and recent[0] is not None
+                    and all(vote is not None and vote[0] == recent[0][0] for vote in recent)):
+                track.stable = True
+                track.label = recent[0][0]
+                track.confidence = float(np.mean([vote[1] for vote in recent]))
+                stabilized.append(track)
+            elif len(track.votes) >= self.max_predictions:
+                # Never settled on one student: stop spending predictions on it
+                track.gave_up = True
+        return stabilized
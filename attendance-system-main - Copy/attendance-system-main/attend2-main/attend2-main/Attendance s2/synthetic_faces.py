@@ -0,0 +1,97 @@
+"""
+Synthetic face generator
+Deterministic, offline stand-ins for student photos and kiosk camera frames,
+used by the benchmark and data seeding tools.
+"""
+
+import base64
+
+import cv2
+import numpy as np
+
+FACE_SIZE = 128
+
+
+def _identity_params(identity):
+    """Derive stable facial geometry for an identity number"""
+    rng = np.random.default_rng(identity)
+    return {
+        'skin': int(rng.integers(150, 215)),
+        'background': int(rng.integers(40, 110)),
+        'face_w': float(rng.uniform(0.30, 0.38)),
+        'face_h': float(rng.uniform(0.40, 0.47)),
+        'eye_y': float(rng.uniform(0.36, 0.44)),
+        'eye_dx': float(rng.uniform(0.12, 0.18)),
+        'eye_r': float(rng.uniform(0.035, 0.055)),
+        'brow_tilt': float(rng.uniform(-0.03, 0.03)),
+        'nose_len': float(rng.uniform(0.10, 0.16)),
+        'mouth_y': float(rng.uniform(0.68, 0.75)),
+        'mouth_w': float(rng.uniform(0.10, 0.18)),
+        'hair': int(rng.integers(10, 80)),
+        'texture_seed': int(rng.integers(0, 2**31 - 1)),
+    }
+
+
+def draw_face(identity, size=FACE_SIZE, variation=0):
+    """Render a grayscale face for `identity`; `variation` adds pose and lighting jitter"""
+    p = _identity_params(identity)
+    jitter = np.random.default_rng((identity, variation))
+    shift = jitter.uniform(-0.02, 0.02, 2) if variation else np.zeros(2)
+    gain = jitter.uniform(0.9, 1.1) if variation else 1.0
+
+    img = np.full((size, size), p['background'], np.uint8)
+    cx = size * (0.5 + shift[0])
+    cy = size * (0.52 + shift[1])
+
+    def pt(x, y):
+        return (int(round(cx + x * size)), int(round(cy + (y - 0.52) * size)))
+
+    def ln(v):
+        return max(1, int(round(v * size)))
+
+    # Hair, head and neck
+    cv2.ellipse(img, pt(0, 0.42), (ln(p['face_w'] + 0.04), ln(p['face_h'] + 0.02)), 0, 180, 360, p['hair'], -1)
+    cv2.rectangle(img, pt(-0.12, 0.85), pt(0.12, 1.2), p['skin'] - 25, -1)
+    cv2.ellipse(img, pt(0, 0.52), (ln(p['face_w']), ln(p['face_h'])), 0, 0, 360, p['skin'], -1)
+
+    # Brows, eyes, nose and mouth
+    for side in (-1, 1):
+        ex = side * p['eye_dx']
+        cv2.line(img, pt(ex - 0.06, p['eye_y'] - 0.07 + side * p['brow_tilt']),
+                 pt(ex + 0.06, p['eye_y'] - 0.07 - side * p['brow_tilt']), p['hair'], ln(0.025))
+        cv2.ellipse(img, pt(ex, p['eye_y']), (ln(p['eye_r'] * 1.6), ln(p['eye_r'])), 0, 0, 360, 235, -1)
+        cv2.circle(img, pt(ex, p['eye_y']), ln(p['eye_r'] * 0.8), 25, -1)
+    cv2.line(img, pt(0, p['eye_y'] + 0.05), pt(0.02, p['eye_y'] + 0.05 + p['nose_len']), p['skin'] - 60, ln(0.015))
+    cv2.ellipse(img, pt(0, p['mouth_y']), (ln(p['mouth_w']), ln(0.03)), 0, 0, 180, 60, ln(0.02))
+
+    # Per-identity skin texture so LBP histograms differ between students
+    texture = np.random.default_rng(p['texture_seed']).normal(0, 9, (size, size))
+    noise = jitter.normal(0, 3, (size, size)) if variation else 0
+    out = (img.astype(np.float32) + texture + noise) * gain
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+def enrollment_face(identity, variation=0):
+    """A 128x128 grayscale face framed the way the Haar cascades crop a frame"""
+    face = draw_face(identity, 220, variation)
+    # The cascades return a box ~5% in from the left, ~3% down and ~90% of the drawn square
+    crop = face[7:205, 11:209]
+    return cv2.resize(crop, (FACE_SIZE, FACE_SIZE))
+
+
+def make_frame(identity, width=640, height=480, face_size=220, variation=0):
+    """Place a synthetic face in a BGR camera-sized frame, returning (frame, box)"""
+    rng = np.random.default_rng((identity, variation, 1))
+    frame = np.full((height, width), 90, np.uint8)
+    frame = cv2.add(frame, rng.integers(0, 20, (height, width), dtype=np.uint8))
+    face = draw_face(identity, face_size, variation)
+    x = (width - face_size) // 2 + int(rng.integers(-20, 21))
+    y = (height - face_size) // 2 + int(rng.integers(-15, 16))
+    frame[y:y + face_size, x:x + face_size] = face
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR), (x, y, face_size, face_size)
+
+
+def to_data_url(frame, quality=90):
+    """Encode a BGR frame as the kiosk sends it (base64 JPEG data URL)"""
+    ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return 'data:image/jpeg;base64,' + base64.b64encode(buf.tobytes()).decode('ascii')
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Multi-tenancy
+Lets one deployment serve several schools. A WSGI middleware picks the school
+from the request (lincoln.attendance.example.com, or /lincoln/... behind a
+single host) and the app then opens that school's own database, face store
+and model under TENANTS_DIR/<school>/. Recognizers are loaded on first use
+and kept in a ModelCache, which evicts the least recently used ones once
+their total size passes a budget, or once they sit idle.
+
+Usage:
+    python tenancy.py add lincoln        # create and initialise a school
+    python tenancy.py list
+"""
+
+import argparse
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from werkzeug.exceptions import NotFound
+
+# School names end up in host names, URLs and directory names
+TENANT_NAME = re.compile(r'^[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?$')
+# First path segments that are never school names in path mode
+RESERVED_NAMES = {'static', 'metrics', 'healthz', 'readyz'}
+# WSGI environ key the middleware stores the school name under
+ENVIRON_KEY = 'attendance.tenant'
+
+_current_tenant = contextvars.ContextVar('tenant', default=None)
+
+
+def current_tenant():
+    """Name of the school being served, or None for the single-school database"""
+    return _current_tenant.get()
+
+
+@contextmanager
+def use_tenant(name):
+    """Run a block (a CLI command, a background job) against one school's data"""
+    token = _current_tenant.set(name)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+def bind_tenant(name):
+    """Set the school for the rest of this context; returns the token for unbind_tenant"""
+    return _current_tenant.set(name)
+
+
+def unbind_tenant(token):
+    _current_tenant.reset(token)
+
+
+def tenant_dir(tenants_dir, name):
+    return os.path.join(tenants_dir, name)
+
+
+def list_tenants(tenants_dir):
+    """Schools with a directory under tenants_dir, sorted by name"""
+    try:
+        names = os.listdir(tenants_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names
+                  if TENANT_NAME.match(name) and os.path.isdir(tenant_dir(tenants_dir, name)))
+
+
+class TenantMiddleware:
+    """WSGI middleware that resolves the school from the Host subdomain or the first path segment
+
+    In path mode the segment is moved from PATH_INFO to SCRIPT_NAME, so the app's
+    routes are unchanged and url_for() builds /<school>/... links by itself.
+    Unknown schools get a 404; shared paths (/static/, /metrics and the health
+    probes) are served without one.
+    """
+
+    def __init__(self, wsgi_app, mode, tenants_dir, domain='', shared_paths=('/static/', '/metrics', '/healthz', '/readyz')):
+        if mode not in ('subdomain', 'path'):
+            raise ValueError(f'unknown tenant mode {mode!r} (use "subdomain" or "path")')
+        if mode == 'subdomain' and not domain:
+            raise ValueError('subdomain mode needs TENANT_DOMAIN, e.g. attendance.example.com')
+        self.wsgi_app = wsgi_app
+        self.mode = mode
+        self.tenants_dir = tenants_dir
+        self.domain = domain.lower().lstrip('.')
+        self.shared_paths = tuple(shared_paths)
+
+    def exists(self, name):
+        return bool(TENANT_NAME.match(name)) and os.path.isdir(tenant_dir(self.tenants_dir, name))
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO') or '/'
+        if self.mode == 'subdomain':
+            host = (environ.get('HTTP_HOST') or environ.get('SERVER_NAME', '')).split(':')[0].lower()
+            name = host[:-len(self.domain) - 1] if host.endswith('.' + self.domain) else ''
+            if self.exists(name):
+                environ[ENVIRON_KEY] = name
+                return self.wsgi_app(environ, start_response)
+        else:
+            name, _, rest = path[1:].partition('/')
+            if name not in RESERVED_NAMES and self.exists(name):
+                environ[ENVIRON_KEY] = name
+                environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/' + name
+                environ['PATH_INFO'] = '/' + rest
+                return self.wsgi_app(environ, start_response)
+
+        if path.startswith(self.shared_paths) or path in self.shared_paths:
+            return self.wsgi_app(environ, start_response)
+        return NotFound('Unknown school')(environ, start_response)
+
+
+class RecognizerState:
+    """One database's recognizer and its bookkeeping (kept while the model itself is evicted)"""
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        # None until a model is trained or loaded, and again after eviction
+        self.recognizer = None
+        # Generation of the published model held, and the version file state it was read at
+        self.version = 0
+        self.stamp = None
+        self.lock = threading.Lock()
+        # Distinct labels of the model held, and ((model version, students table version), labels whose
+        # student has been deleted); deletions live in the database, so every process sees them
+        self.labels = ()
+        self.tombstones = (None, frozenset())
+        # (model version, lbph.HistogramMatcher) for multi-face frames, built on first use
+        self.matcher = None
+        self.compaction_lock = threading.Lock()
+        self.compaction_timer = None
+
+
+class ModelCache:
+    """LRU bookkeeping for loaded models, bounded by their total size and by idle time
+
+    The cache only tracks key -> (bytes, last use); the owner keeps the models and
+    drops one when on_evict(key, reason) is called, with reason 'budget' or 'idle'.
+    The model being touched is never evicted, even when it alone is over budget.
+    """
+
+    def __init__(self, max_bytes, idle_seconds, on_evict):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def touch(self, key, nbytes=None):
+        """Mark `key` as just used (and its size when it was just loaded), then evict as needed"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and nbytes is None:
+                return
+            if nbytes is not None:
+                self._bytes += nbytes - (entry[0] if entry else 0)
+            else:
+                nbytes = entry[0]
+            self._entries[key] = (nbytes, now)
+            self._entries.move_to_end(key)
+            # Least recently used first; anything idle too long goes whatever the budget
+            cutoff = now - self.idle_seconds
+            for other, (size, last_used) in list(self._entries.items()):
+                if other == key:
+                    break
+                if self._bytes > self.max_bytes:
+                    reason = 'budget'
+                elif last_used < cutoff:
+                    reason = 'idle'
+                else:
+                    break
+                del self._entries[other]
+                self._bytes -= size
+                evicted.append((other, reason))
+        # Callbacks take the owner's locks, so they run after ours is released
+        for other, reason in evicted:
+            self.on_evict(other, reason)
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._bytes -= entry[0]
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the schools served by a multi-tenant deployment')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='create a school and initialise its database')
+    add.add_argument('name', help='lowercase letters, digits and "-" (used in host names and URLs)')
+    commands.add_parser('list', help='show the schools under TENANTS_DIR')
+    args = parser.parse_args()
+
+    import app
+
+    if args.command == 'add':
+        if not TENANT_NAME.match(args.name) or args.name in RESERVED_NAMES:
+            raise SystemExit(f'invalid school name {args.name!r}')
+        os.makedirs(tenant_dir(app.TENANTS_DIR, args.name), exist_ok=True)
+        with use_tenant(args.name):
+            app.init_db()
+            print(f'{args.name}: {app.database_path()} (sign in as admin / admin123 and change the password)')
+    else:
+        for name in list_tenants(app.TENANTS_DIR):
+            with use_tenant(name):
+                path = app.database_path()
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+            print(f'{name:<24}{size:>12} bytes  {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+# The app is a set of flat modules next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def attendance(tmp_path, monkeypatch):
+    """The app module pointed at a fresh database (with its face store and model) under tmp_path"""
+    import app
+
+    monkeypatch.setattr(app, 'DATABASE', str(tmp_path / 'attendance.db'))
+    monkeypatch.setattr(app, '_initialized_databases', set())
+    monkeypatch.setattr(app, '_face_stores', {})
+    monkeypatch.setattr(app, '_recognizer_states', {})
+    app.init_db()
+    yield app
+    # A deletion schedules a compaction; it must not fire once DATABASE points elsewhere again
+    for state in app._recognizer_states.values():
+        if state.compaction_timer is not None:
+            state.compaction_timer.cancel()
+
+
+@pytest.fixture
+def enrolled(attendance):
+    """Three enrolled synthetic students and a trained model; returns their database ids by identity"""
+    from synthetic_faces import enrollment_face
+
+    slots = attendance.get_face_store().extend(attendance.preprocess_faces([enrollment_face(i) for i in range(3)]))
+    conn = attendance.get_db()
+    ids = [conn.execute('INSERT INTO students (name, student_id, face_slot) VALUES (?, ?, ?)',
+                        (f'Student {slot}', f'ID{slot}', slot)).lastrowid for slot in slots]
+    conn.commit()
+    conn.close()
+    attendance.train_face_recognizer()
+    return ids
+
+
+@pytest.fixture
+def client(attendance):
+    """Flask test client signed in as the default admin of the fresh database"""
+    client = attendance.app.test_client()
+    with client.session_transaction() as session:
+        session.update(user_id=1, username='admin', role='admin', tenant=None)
+    return client
+
+
+def add_students(attendance, *names):
+    """Insert students named `names` (student ids ID<n> numbered on from those already there); returns their database ids"""
+    conn = attendance.get_db()
+    first = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+    ids = [conn.execute('INSERT INTO students (name, student_id, email) VALUES (?, ?, ?)',
+                        (name, f'ID{i}', f'{name.split()[0].lower()}@example.com')).lastrowid
+           for i, name in enumerate(names, first)]
+    conn.commit()
+    conn.close()
+    return ids
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionControl, Overloaded
+
+
+@pytest.fixture
+def admission(attendance, monkeypatch):
+    """One recognition slot, room for one request to wait for it for a tenth of a second"""
+    control = AdmissionControl(1, 1, 0.1)
+    monkeypatch.setattr(attendance, 'recognition_admission', control)
+    return control
+
+
+def hold_slot(admission):
+    """Occupy one slot from another thread until the returned event is set"""
+    release, held = threading.Event(), threading.Event()
+
+    def occupy():
+        with admission.admit():
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=occupy)
+    thread.start()
+    held.wait()
+    return release, thread
+
+
+def test_full_queue_is_turned_away_with_retry_after(admission, client):
+    admission.max_queue = 0
+    with admission.admit():
+        response = client.post('/mark_attendance', json={})
+    assert response.status_code == 503
+    body = response.get_json()
+    assert body['busy'] is True
+    assert response.headers['Retry-After'] == str(body['retry_after'])
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_queued_request_times_out(admission, client):
+    with admission.admit():
+        response = client.post('/mark_attendance/face', json={})
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    assert admission.waiting == 0
+
+
+def test_a_free_slot_runs_the_view(admission, client):
+    response = client.post('/mark_attendance', json={})
+    assert response.status_code != 503
+    assert admission.in_flight == 0
+
+
+def test_only_signed_in_recognition_work_is_admitted(attendance, admission):
+    with admission.admit():
+        assert attendance.app.test_client().post('/mark_attendance', json={}).status_code == 401
+
+
+def test_waiting_request_gets_the_slot_when_it_is_freed():
+    admission = AdmissionControl(1, 1, 5)
+    results = []
+    release, holder = hold_slot(admission)
+
+    def wait_for_slot():
+        with admission.admit() as waited:
+            results.append(waited)
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    while admission.waiting == 0:
+        time.sleep(0.001)
+    with pytest.raises(Overloaded) as turned_away:
+        with admission.admit():
+            pass
+    assert turned_away.value.reason == 'queue_full'
+
+    release.set()
+    waiter.join()
+    holder.join()
+    assert len(results) == 1 and results[0] > 0
+    assert (admission.in_flight, admission.waiting) == (0, 0)
@@ -0,0 +1,90 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import archive
+from conftest import add_students
+
+TODAY = date.today().isoformat()
+
+
+@pytest.fixture
+def marked(attendance, monkeypatch):
+    """Two students with attendance in a closed 2025 term and today; returns their ids"""
+    monkeypatch.setattr(attendance, 'ARCHIVE_DIR', '')
+    ada, alan = add_students(attendance, 'Ada Lovelace', 'Alan Turing')
+    conn = attendance.get_db()
+    conn.executemany('INSERT INTO attendance (student_id, date, time, status, marked_by) VALUES (?, ?, ?, ?, 1)', [
+        (ada, '2025-01-06', '08:00:00', 'present'),
+        (alan, '2025-01-06', '08:10:00', 'late'),
+        (ada, '2025-03-03', '08:00:00', 'present'),
+        (ada, TODAY, '08:00:00', 'present'),
+    ])
+    conn.commit()
+    conn.close()
+    return ada, alan
+
+
+def history(client, **params):
+    response = client.get('/api/attendance/history', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_close_term_moves_rows_out_of_the_hot_table(attendance, marked):
+    summary = archive.close_term('2025-T1', '2025-01-01', '2025-04-04')
+    assert summary['rows'] == 3
+    assert os.path.dirname(summary['archive']) == os.path.join(os.path.dirname(attendance.DATABASE), 'archive')
+
+    conn = attendance.get_db()
+    assert conn.execute('SELECT date FROM attendance').fetchall() == [(TODAY,)]
+    conn.close()
+    assert [term[:4] for term in archive.list_terms()] == [('2025-T1', '2025-01-01', '2025-04-04', 3)]
+
+
+@pytest.mark.parametrize('name, start, end', [
+    ('../escape', '2025-01-01', '2025-04-04'),
+    ('2025-T1', '2025-04-04', '2025-01-01'),
+    ('open', '2025-01-01', (date.today() + timedelta(days=1)).isoformat()),
+])
+def test_close_term_rejects_bad_terms(marked, name, start, end):
+    with pytest.raises(ValueError):
+        archive.close_term(name, start, end)
+
+
+def test_terms_cannot_overlap(marked):
+    archive.close_term('2025-T1', '2025-01-01', '2025-02-28', vacuum=False)
+    with pytest.raises(ValueError, match='overlaps'):
+        archive.close_term('2025-T1b', '2025-02-01', '2025-04-04', vacuum=False)
+
+
+def test_history_reads_archived_terms(attendance, marked, client):
+    archive.close_term('2025-T1', '2025-01-01', '2025-02-28', vacuum=False)
+    archive.close_term('2025-T2', '2025-03-01', '2025-04-04', vacuum=False)
+
+    body = history(client)
+    assert body['terms'] == ['current', '2025-T2', '2025-T1']
+    assert [(record['date'], record['term']) for record in body['records']] == [
+        (TODAY, 'current'), ('2025-03-03', '2025-T2'), ('2025-01-06', '2025-T1'), ('2025-01-06', '2025-T1')]
+    assert body['records'][-1]['student']['name'] == 'Ada Lovelace'
+
+    ada, alan = marked
+    body = history(client, start='2025-01-01', end='2025-01-31', student=alan)
+    assert body['terms'] == ['current', '2025-T1']
+    assert [(record['status'], record['student']['id']) for record in body['records']] == [('late', alan)]
+    assert len(history(client, limit=2)['records']) == 2
+
+
+def test_history_skips_a_missing_term_file(marked, client):
+    summary = archive.close_term('2025-T1', '2025-01-01', '2025-04-04', vacuum=False)
+    os.remove(summary['archive'])
+
+    body = history(client)
+    assert body['terms'] == ['current']
+    assert [record['date'] for record in body['records']] == [TODAY]
+
+
+def test_history_validates_dates(attendance, client):
+    assert client.get('/api/attendance/history?start=yesterday').status_code == 400
+    assert attendance.app.test_client().get('/api/attendance/history').status_code == 403
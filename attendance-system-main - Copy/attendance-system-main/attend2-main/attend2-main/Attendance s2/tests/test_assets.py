@@ -0,0 +1,74 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+import assets
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    """A copy of static/ without any previous build, plus a stylesheet that references a font"""
+    path = tmp_path / 'static'
+    shutil.copytree(assets.STATIC_DIR, path, ignore=shutil.ignore_patterns(assets.DIST_NAME))
+    (path / 'fonts').mkdir()
+    (path / 'fonts' / 'icons.woff2').write_bytes(b'font')
+    (path / 'icons.css').write_text("@font-face { src: url('fonts/icons.woff2?v=1#iefix') }\n"
+                                    ".a { background: url(data:image/png;base64,AA) }\n" + '/* padding */\n' * 100)
+    return str(path)
+
+
+@pytest.fixture
+def built(attendance, static_dir, monkeypatch):
+    """The app serving a fresh asset build of static_dir; returns the manifest"""
+    assets.build(static_dir)
+    manifest = assets.load_manifest(static_dir)
+    monkeypatch.setattr(attendance.app, 'static_folder', static_dir)
+    monkeypatch.setattr(attendance, 'ASSET_MANIFEST', manifest)
+    return manifest
+
+
+def test_build_fingerprints_and_rewrites_stylesheets(static_dir):
+    report = assets.build(static_dir)
+    manifest = assets.load_manifest(static_dir)
+    assert set(manifest) == set(report) and 'style.css' in manifest
+    font = manifest['fonts/icons.woff2']
+    assert font.startswith('fonts/icons.') and font.endswith('.woff2')
+
+    with open(os.path.join(static_dir, assets.DIST_NAME, manifest['icons.css'])) as f:
+        css = f.read()
+    assert f"url('{font}?v=1#iefix')" in css
+    assert 'url(data:image/png;base64,AA)' in css
+    # Small and already compressed files get no .gz
+    assert 'gzip' in report['icons.css'] and 'gzip' not in report['fonts/icons.woff2']
+
+
+def test_same_content_builds_the_same_names(static_dir):
+    first = assets.build(static_dir)
+    assert assets.build(static_dir, clean=True) == first
+
+
+def test_pages_link_the_fingerprinted_files(built, client):
+    page = client.get('/').get_data(as_text=True)
+    assert f"/static/dist/{built['style.css']}" in page
+
+
+def test_unbuilt_assets_fall_back_to_plain_static_urls(attendance, client, monkeypatch):
+    monkeypatch.setattr(attendance, 'ASSET_MANIFEST', {})
+    assert '/static/style.css' in client.get('/').get_data(as_text=True)
+
+
+def test_assets_are_immutable_and_precompressed(built, client):
+    url = f"/static/dist/{built['icons.css']}"
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Content-Type'].startswith('text/css')
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    raw = client.get(url)
+    assert 'Content-Encoding' not in raw.headers
+    assert gzip.decompress(response.get_data()) == raw.get_data()
+
+    assert client.get('/static/dist/missing.0123456789.css').status_code == 404
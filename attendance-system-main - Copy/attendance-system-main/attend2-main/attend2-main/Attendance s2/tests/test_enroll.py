@@ -0,0 +1,72 @@
+import io
+
+import cv2
+import pytest
+from PIL import Image
+
+from synthetic_faces import make_frame
+
+
+def photo(identity=0, scale=1, rotate=False, fmt='JPEG'):
+    """A camera photo of one synthetic student, `scale` times the kiosk frame size; optionally stored
+    sideways with an EXIF orientation that turns it upright again"""
+    frame = make_frame(identity, variation=1)[0]
+    if scale != 1:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    exif = Image.Exif()
+    if rotate:
+        image = image.transpose(Image.Transpose.ROTATE_90)
+        exif[0x0112] = 6
+    out = io.BytesIO()
+    image.save(out, fmt, exif=exif)
+    return out.getvalue()
+
+
+def enroll(client, data, name='Ada Lovelace', student_id='S1'):
+    return client.post('/enroll', data={'name': name, 'student_id': student_id, 'email': 'ada@example.com',
+                                        'photo': (io.BytesIO(data), 'photo.jpg')},
+                       content_type='multipart/form-data')
+
+
+def enrolled_students(attendance):
+    conn = attendance.get_db()
+    rows = conn.execute('SELECT name, face_slot FROM students').fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.mark.parametrize('data', [photo(), photo(scale=6), photo(rotate=True), photo(fmt='PNG')],
+                         ids=['frame', 'large', 'exif_rotated', 'png'])
+def test_enrollment_stores_the_face_and_trains(attendance, client, data):
+    response = enroll(client, data)
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/students'
+    assert enrolled_students(attendance) == [('Ada Lovelace', 0)]
+    assert len(attendance.get_face_store()) == 1
+    assert attendance.sync_face_recognizer() is not None
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'not an image', 'Could not read the photo'),
+    (photo(0)[:2000], 'Could not read the photo'),
+    (cv2.imencode('.jpg', cv2.cvtColor(make_frame(0)[0] * 0, cv2.COLOR_BGR2GRAY))[1].tobytes(), 'No face detected'),
+])
+def test_unusable_photos_are_rejected(attendance, client, data, message):
+    response = enroll(client, data)
+    assert response.status_code == 200
+    assert message in response.get_data(as_text=True)
+    assert enrolled_students(attendance) == []
+
+
+def test_oversized_photo_is_rejected(attendance, client, monkeypatch):
+    monkeypatch.setattr(attendance, 'MAX_UPLOAD_BYTES', 1024)
+    assert 'Photo is too large' in enroll(client, photo()).get_data(as_text=True)
+    assert enrolled_students(attendance) == []
+
+
+def test_duplicate_student_id_is_rejected(attendance, client):
+    enroll(client, photo(0))
+    response = enroll(client, photo(1), name='Alan Turing')
+    assert 'Student ID already exists' in response.get_data(as_text=True)
+    assert enrolled_students(attendance) == [('Ada Lovelace', 0)]
@@ -0,0 +1,220 @@
+import os
+
+import numpy as np
+import pytest
+
+from face_store import FaceStore
+from synthetic_faces import enrollment_face
+
+
+def solid_faces(values):
+    """One 128x128 face per value, every pixel set to it, so a slot's face is easy to recognise"""
+    return np.stack([np.full((128, 128), value, np.uint8) for value in values])
+
+
+def face_values(faces):
+    return [int(face[0, 0]) for face in faces]
+
+
+def test_append_and_extend_return_slots(tmp_path):
+    store = FaceStore(str(tmp_path / 'gallery.faces'))
+    assert store.append(solid_faces([7])[0]) == 0
+    assert list(store.extend(solid_faces([8, 9]))) == [1, 2]
+    assert face_values(store.faces()) == [7, 8, 9]
+
+
+def test_append_after_a_torn_tail_stays_aligned(tmp_path):
+    path = tmp_path / 'gallery.faces'
+    store = FaceStore(str(path))
+    store.extend(solid_faces([7, 8]))
+    # A write cut short by a crash or a full disk
+    with open(path, 'ab') as f:
+        f.write(solid_faces([99]).tobytes()[:1000])
+    assert len(store) == 2
+
+    assert store.append(solid_faces([9])[0]) == 2
+    assert list(store.extend(solid_faces([10, 11]))) == [3, 4]
+    assert path.stat().st_size == 5 * store.stride
+    assert face_values(store.faces()) == [7, 8, 9, 10, 11]
+    assert np.array_equal(store.get(4), solid_faces([11])[0])
+
+
+def test_compact_is_invisible_until_finished(tmp_path):
+    store = FaceStore(str(tmp_path / 'gallery.faces'))
+    store.extend(solid_faces([10, 11, 12, 13, 14]))
+
+    store.compact([1, 3, 4])
+    assert store.pending_compaction() == 3
+    assert face_values(store.faces()) == [10, 11, 12, 13, 14]
+
+    store.finish_compaction()
+    assert store.pending_compaction() is None
+    assert face_values(store.faces()) == [11, 13, 14]
+
+
+def test_discard_compaction_keeps_the_store(tmp_path):
+    store = FaceStore(str(tmp_path / 'gallery.faces'))
+    store.extend(solid_faces([10, 11, 12]))
+    store.compact([2])
+    store.discard_compaction()
+    assert store.pending_compaction() is None
+    assert face_values(store.faces()) == [10, 11, 12]
+
+
+def test_compact_rejects_unknown_slots(tmp_path):
+    store = FaceStore(str(tmp_path / 'gallery.faces'))
+    store.extend(solid_faces([10, 11]))
+    with pytest.raises(IndexError):
+        store.compact([0, 2])
+    assert store.pending_compaction() is None
+
+
+def enroll(attendance, values):
+    """Students whose stored face is solid `value`; returns {student id: value}"""
+    slots = attendance.get_face_store().extend(solid_faces(values))
+    conn = attendance.get_db()
+    ids = {}
+    for value, slot in zip(values, slots):
+        cursor = conn.execute('INSERT INTO students (name, student_id, face_slot) VALUES (?, ?, ?)',
+                              (f'Student {value}', f'ID{value}', slot))
+        ids[cursor.lastrowid] = value
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def stored_faces(attendance):
+    """{student id: value of the face its slot points at}"""
+    faces = attendance.get_face_store().faces()
+    conn = attendance.get_db()
+    rows = conn.execute('SELECT id, face_slot FROM students WHERE face_slot IS NOT NULL').fetchall()
+    conn.close()
+    return {student: int(faces[slot][0, 0]) for student, slot in rows}
+
+
+def delete(attendance, student_ids):
+    conn = attendance.get_db()
+    conn.executemany('DELETE FROM students WHERE id = ?', [(student,) for student in student_ids])
+    conn.commit()
+    conn.close()
+
+
+def test_compaction_renumbers_slots(attendance):
+    ids = enroll(attendance, [20, 21, 22, 23, 24])
+    deleted = list(ids)[1:4:2]
+    delete(attendance, deleted)
+
+    attendance.compact_face_store()
+
+    expected = {student: value for student, value in ids.items() if student not in deleted}
+    assert len(attendance.get_face_store()) == len(expected)
+    assert stored_faces(attendance) == expected
+
+
+def test_failed_renumbering_leaves_the_store_alone(attendance, monkeypatch):
+    ids = enroll(attendance, [30, 31, 32])
+    delete(attendance, [list(ids)[0]])
+    real_get_db = attendance.get_db
+
+    class FailingCommit:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+        def commit(self):
+            raise attendance.sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(attendance, 'get_db', lambda: FailingCommit(real_get_db()))
+    with pytest.raises(attendance.sqlite3.OperationalError):
+        attendance.compact_face_store()
+    monkeypatch.setattr(attendance, 'get_db', real_get_db)
+
+    store = attendance.get_face_store()
+    assert store.pending_compaction() is None
+    assert len(store) == 3
+    assert stored_faces(attendance) == {student: value for student, value in list(ids.items())[1:]}
+
+
+def test_crash_after_renumbering_is_finished(attendance):
+    ids = enroll(attendance, [40, 41, 42])
+    first, *kept = ids
+    delete(attendance, [first])
+    store = attendance.get_face_store()
+    # A crash after the slots were committed but before the compacted file was swapped in
+    store.compact([1, 2])
+    conn = attendance.get_db()
+    conn.executemany('UPDATE students SET face_slot = ? WHERE id = ?', [(0, kept[0]), (1, kept[1])])
+    conn.commit()
+    conn.close()
+
+    with attendance.gallery_lock():
+        pass
+
+    assert store.pending_compaction() is None
+    assert stored_faces(attendance) == {student: ids[student] for student in kept}
+
+
+def test_crash_before_renumbering_is_discarded(attendance):
+    ids = enroll(attendance, [50, 51, 52])
+    first = next(iter(ids))
+    delete(attendance, [first])
+    store = attendance.get_face_store()
+    store.compact([1, 2])
+
+    with attendance.gallery_lock():
+        pass
+
+    assert store.pending_compaction() is None
+    assert len(store) == 3
+    assert stored_faces(attendance) == {student: value for student, value in ids.items() if student != first}
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_worker_schedules_its_own_compaction(attendance, monkeypatch):
+    monkeypatch.setattr(attendance, 'COMPACTION_DELAY_SECONDS', 3600)
+    attendance.schedule_compaction()
+    state = attendance.recognizer_state()
+    parent_timer = state.compaction_timer
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Child: a fresh handle, so a deletion seen here schedules a compaction in this process
+        ok = state.compaction_timer is None
+        attendance.schedule_compaction()
+        ok = ok and state.compaction_timer is not None and state.compaction_timer.is_alive()
+        os.write(write, b'1' if ok else b'0')
+        os._exit(0)
+    os.close(write)
+    try:
+        assert os.read(read, 1) == b'1'
+    finally:
+        os.close(read)
+        os.waitpid(pid, 0)
+        parent_timer.cancel()
+    assert state.compaction_timer is parent_timer
+
+
+def test_a_deleted_student_stops_matching_before_compaction(attendance, enrolled, client, monkeypatch):
+    monkeypatch.setattr(attendance, 'COMPACTION_DELAY_SECONDS', 3600)
+    state = attendance.recognizer_state()
+    version = state.version
+    probes = attendance.preprocess_faces([enrollment_face(i, variation=1) for i in range(3)])
+    assert attendance.predict_face(probes[1])[0] == enrolled[1]
+
+    assert client.post(f'/delete_student/{enrolled[1]}').get_json()['success'] is True
+    assert state.compaction_timer is not None
+
+    # No retrain: the label is skipped by single and multi-face prediction alike
+    assert attendance.predict_face(probes[1])[0] != enrolled[1]
+    assert enrolled[1] not in [label for label, _ in attendance.predict_faces(probes)]
+    assert [label for label, _ in attendance.predict_faces(probes[::2])] == enrolled[::2]
+    assert state.version == version
+
+    state.compaction_timer.cancel()
+    attendance.compact_face_store()
+    assert len(attendance.get_face_store()) == 2
+    assert state.version > version
+    assert enrolled[1] not in attendance.sync_face_recognizer().getLabels()
+    assert attendance.predict_face(probes[2])[0] == enrolled[2]
@@ -0,0 +1,70 @@
+from datetime import date
+
+import pytest
+
+import finalize
+from conftest import add_students
+
+
+@pytest.fixture
+def school(attendance):
+    """Three students enrolled in 2025 and two marks on 2025-03-03; returns their ids"""
+    ids = add_students(attendance, 'Ada Lovelace', 'Alan Turing', 'Grace Hopper')
+    conn = attendance.get_db()
+    conn.execute("UPDATE students SET created_at = '2025-01-01 00:00:00'")
+    conn.executemany('INSERT INTO attendance (student_id, date, time, marked_by) VALUES (?, ?, ?, 1)', [
+        (ids[0], '2025-03-03', '08:00:00'),
+        (ids[1], '2025-03-03', '08:40:00'),
+    ])
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def statuses(attendance, day):
+    conn = attendance.get_db()
+    rows = conn.execute('SELECT student_id, status FROM attendance WHERE date = ? ORDER BY student_id', (day,)).fetchall()
+    conn.close()
+    return rows
+
+
+def test_finalize_writes_absentees_and_daily_counts(attendance, school):
+    ada, alan, grace = school
+    assert finalize.finalize() == [{'date': '2025-03-03', 'present': 1, 'late': 1, 'absent': 1}]
+    assert statuses(attendance, '2025-03-03') == [(ada, 'present'), (alan, 'late'), (grace, 'absent')]
+
+    conn = attendance.get_db()
+    assert conn.execute('SELECT late_cutoff, present, late, absent FROM attendance_days').fetchall() == [
+        ('08:15:00', 1, 1, 1)]
+    conn.close()
+
+
+def test_a_day_is_finalized_once(attendance, school):
+    finalize.finalize(cutoff='09:00')
+    assert finalize.finalize() == []
+    assert finalize.finalize(['2025-03-03']) == []
+    assert [status for _, status in statuses(attendance, '2025-03-03')] == ['present', 'present', 'absent']
+
+
+def test_students_enrolled_later_are_not_absent(attendance, school):
+    late_joiner, = add_students(attendance, 'Katherine Johnson')
+    finalize.finalize()
+    assert late_joiner not in [student for student, _ in statuses(attendance, '2025-03-03')]
+
+
+def test_a_named_day_with_no_marks_is_all_absent(attendance, school):
+    assert finalize.finalize(['2025-03-04']) == [{'date': '2025-03-04', 'present': 0, 'late': 0, 'absent': 3}]
+
+
+@pytest.mark.parametrize('days, cutoff', [([date.today().isoformat()], '08:15'), (None, '8.15')])
+def test_finalize_rejects_bad_input(school, days, cutoff):
+    with pytest.raises(ValueError):
+        finalize.finalize(days, cutoff)
+
+
+def test_finalized_absences_show_in_student_stats(attendance, school, client):
+    finalize.finalize()
+    stats = client.get(f'/api/students/{school[2]}').get_json()['stats']
+    assert (stats['total'], stats['present'], stats['late'], stats['absent']) == (0, 0, 0, 1)
+    stats = client.get(f'/api/students/{school[1]}').get_json()['stats']
+    assert (stats['total'], stats['present'], stats['late'], stats['absent']) == (1, 0, 1, 0)
@@ -0,0 +1,135 @@
+import threading
+
+import pytest
+
+from group_commit import GroupCommitWriter
+
+TIMEOUT = 5
+
+
+def test_results_come_back_in_order():
+    batches = []
+
+    def apply(key, items):
+        batches.append((key, list(items)))
+        return [item * 10 for item in items]
+
+    writer = GroupCommitWriter(apply, max_batch=8, max_delay=0.2)
+    futures = [writer.submit('db', item) for item in range(1, 5)]
+
+    assert [future.result(TIMEOUT) for future in futures] == [10, 20, 30, 40]
+    # Submitted well within max_delay of each other, so one batch
+    assert batches == [('db', [1, 2, 3, 4])]
+
+
+def test_items_are_grouped_per_key():
+    batches = []
+
+    def apply(key, items):
+        batches.append((key, list(items)))
+        return list(items)
+
+    writer = GroupCommitWriter(apply, max_batch=8, max_delay=0.2)
+    futures = [writer.submit(key, item) for key, item in [('a', 1), ('b', 2), ('a', 3)]]
+
+    assert [future.result(TIMEOUT) for future in futures] == [1, 2, 3]
+    assert sorted(batches) == [('a', [1, 3]), ('b', [2])]
+
+
+def test_failing_apply_fails_its_batch_and_the_writer_goes_on():
+    def apply(key, items):
+        if 'bad' in items:
+            raise ValueError('no')
+        return list(items)
+
+    writer = GroupCommitWriter(apply)
+    with pytest.raises(ValueError):
+        writer.submit('db', 'bad').result(TIMEOUT)
+    assert writer.submit('db', 'good').result(TIMEOUT) == 'good'
+
+
+def test_wrong_number_of_results_fails_the_batch():
+    writer = GroupCommitWriter(lambda key, items: [], max_batch=1)
+    with pytest.raises(RuntimeError):
+        writer.submit('db', 1).result(TIMEOUT)
+
+
+def test_failing_on_batch_is_reported_and_the_writer_goes_on():
+    errors = []
+
+    def on_batch(key, size, seconds):
+        raise ZeroDivisionError
+
+    writer = GroupCommitWriter(lambda key, items: list(items), on_batch=on_batch,
+                               on_error=lambda key, error: errors.append((key, error)))
+    assert writer.submit('db', 1).result(TIMEOUT) == 1
+    assert writer.submit('db', 2).result(TIMEOUT) == 2
+    assert [key for key, _ in errors] == ['db', 'db']
+    assert all(isinstance(error, ZeroDivisionError) for _, error in errors)
+
+
+def test_writer_failure_fails_pending_futures(monkeypatch):
+    errors = []
+    writer = GroupCommitWriter(lambda key, items: list(items), on_error=lambda key, error: errors.append(error))
+    calls = []
+
+    def broken_write(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise RuntimeError('boom')
+        return GroupCommitWriter._write(writer, batch)
+
+    monkeypatch.setattr(writer, '_write', broken_write)
+    with pytest.raises(RuntimeError):
+        writer.submit('db', 1).result(TIMEOUT)
+    assert writer.submit('db', 2).result(TIMEOUT) == 2
+    assert [str(error) for error in errors] == ['boom']
+
+
+def test_cancelled_requests_are_not_written():
+    written = []
+    release = threading.Event()
+
+    def apply(key, items):
+        release.wait(TIMEOUT)
+        written.extend(items)
+        return list(items)
+
+    writer = GroupCommitWriter(apply, max_batch=1)
+    first = writer.submit('db', 1)
+    cancelled = writer.submit('db', 2)
+    assert cancelled.cancel()
+    last = writer.submit('db', 3)
+    release.set()
+
+    assert first.result(TIMEOUT) == 1
+    assert last.result(TIMEOUT) == 3
+    assert written == [1, 3]
+
+
+def test_duplicate_marks_in_one_batch_insert_once(attendance):
+    conn = attendance.get_db()
+    student = conn.execute("INSERT INTO students (name, student_id) VALUES ('Ada', 'ID1')").lastrowid
+    conn.commit()
+    conn.close()
+
+    mark = (student, '2026-01-05', '08:00:00', 1)
+    other_day = (student, '2026-01-06', '08:00:00', 1)
+    assert attendance.write_marks(attendance.DATABASE, [mark, mark, other_day]) == [True, False, True]
+    assert attendance.write_marks(attendance.DATABASE, [mark]) == [False]
+
+    conn = attendance.get_db()
+    rows = conn.execute('SELECT date FROM attendance WHERE student_id = ? ORDER BY date', (student,)).fetchall()
+    conn.close()
+    assert [row[0] for row in rows] == ['2026-01-05', '2026-01-06']
+
+
+def test_record_marks_goes_through_the_writer(attendance):
+    conn = attendance.get_db()
+    students = [conn.execute('INSERT INTO students (name, student_id) VALUES (?, ?)', (f'S{i}', f'ID{i}')).lastrowid
+                for i in range(3)]
+    conn.commit()
+    conn.close()
+
+    assert attendance.record_marks(students, 1) == {student: True for student in students}
+    assert attendance.record_marks(students[:1], 1) == {students[0]: False}
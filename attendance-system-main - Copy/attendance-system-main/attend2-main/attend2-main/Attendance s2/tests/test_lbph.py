@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+import pytest
+
+from lbph import HistogramMatcher, chi_square_distances, spatial_histograms
+from synthetic_faces import enrollment_face
+
+GALLERY = 12
+
+
+@pytest.fixture(scope='module')
+def trained():
+    """An LBPH model over a small synthetic gallery, with probe faces of the same students"""
+    faces = np.stack([enrollment_face(i) for i in range(GALLERY)])
+    labels = np.arange(GALLERY, dtype=np.int32) + 100
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train(list(faces), labels)
+    probes = np.stack([enrollment_face(i, variation=1) for i in range(GALLERY)])
+    return recognizer, labels, probes
+
+
+def test_histograms_match_opencv(trained):
+    recognizer, _, _ = trained
+    faces = np.stack([enrollment_face(i) for i in range(GALLERY)])
+    assert np.array_equal(spatial_histograms(faces), np.concatenate(recognizer.getHistograms()))
+
+
+def test_distances_match_opencv_predict(trained):
+    recognizer, labels, probes = trained
+    gallery = np.concatenate(recognizer.getHistograms())
+    distances = chi_square_distances(spatial_histograms(probes), gallery)
+    for probe, row in zip(probes, distances):
+        label, distance = recognizer.predict(probe)
+        assert labels[row.argmin()] == label
+        assert row.min() == pytest.approx(distance, rel=1e-5)
+
+
+def test_distance_blocks_do_not_change_results(trained, monkeypatch):
+    recognizer, _, probes = trained
+    gallery = np.concatenate(recognizer.getHistograms())
+    queries = spatial_histograms(probes)
+    expected = chi_square_distances(queries, gallery)
+    # One query and one gallery row per block, then all queries and a last block shorter than the others
+    monkeypatch.setattr('lbph.DISTANCE_BLOCK_BYTES', 1)
+    assert np.array_equal(chi_square_distances(queries, gallery), expected)
+    monkeypatch.setattr('lbph.DISTANCE_BLOCK_BYTES', 4 * queries.size * 5)
+    assert np.array_equal(chi_square_distances(queries, gallery), expected)
+    # Groups of five queries, the last one shorter
+    monkeypatch.setattr('lbph.DISTANCE_BLOCK_BYTES', 4 * queries.shape[1] * 5)
+    assert np.array_equal(chi_square_distances(queries, gallery), expected)
+
+
+def test_empty_inputs():
+    assert chi_square_distances(np.empty((0, 16)), np.ones((3, 16), np.float32)).shape == (0, 3)
+    assert chi_square_distances(np.ones((2, 16)), np.empty((0, 16), np.float32)).shape == (2, 0)
+
+
+def test_matcher_predicts_like_opencv(trained):
+    recognizer, _, probes = trained
+    predicted = HistogramMatcher.from_recognizer(recognizer).predict(probes)
+    for probe, (label, distance) in zip(probes, predicted):
+        expected_label, expected_distance = recognizer.predict(probe)
+        assert label == expected_label
+        assert distance == pytest.approx(expected_distance, rel=1e-5)
+
+
+def test_matcher_skips_excluded_labels(trained):
+    recognizer, _, probes = trained
+    matcher = HistogramMatcher.from_recognizer(recognizer)
+    deleted = matcher.predict(probes[:1])[0][0]
+    row = matcher.distances(probes[:1])[0]
+    row[matcher.labels == deleted] = np.inf
+
+    label, distance = matcher.predict(probes[:1], exclude={deleted})[0]
+    assert label == matcher.labels[row.argmin()] != deleted
+    assert distance == row.min()
+
+
+def test_matcher_threshold(trained):
+    recognizer, _, probes = trained
+    matcher = HistogramMatcher.from_recognizer(recognizer)
+    distance = matcher.predict(probes[:1])[0][1]
+    matcher.threshold = distance
+    assert matcher.predict(probes[:1]) == [(-1, float('inf'))]
+    matcher.threshold = np.nextafter(distance, np.inf)
+    assert matcher.predict(probes[:1])[0][1] == distance
@@ -0,0 +1,124 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+from synthetic_faces import draw_face, make_frame, to_data_url
+
+
+def mark(client, frame):
+    return client.post('/mark_attendance', json={'image_data': to_data_url(frame)})
+
+
+def gray_frame(image):
+    return cv2.cvtColor(np.ascontiguousarray(image, np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+@pytest.mark.parametrize('frame, reason', [
+    (gray_frame(np.full((480, 640), 10)), 'too_dark'),
+    (gray_frame(np.full((480, 640), 250)), 'too_bright'),
+    (gray_frame(np.full((480, 640), 128)), 'low_contrast'),
+    # A smooth ramp has contrast but no edges
+    (gray_frame(np.tile(np.linspace(0, 255, 640), (480, 1))), 'blurry'),
+    (np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8), 'no_face'),
+])
+def test_unusable_frames_are_rejected_with_a_hint(attendance, enrolled, client, frame, reason):
+    response = mark(client, frame)
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['reason'] == reason
+    assert body['message'] == attendance.TRIAGE_HINTS[reason]
+
+
+def test_small_faces_are_rejected(attendance, enrolled, client, monkeypatch):
+    monkeypatch.setattr(attendance, 'TRIAGE_MIN_FACE_FRACTION', 0.9)
+    assert mark(client, make_frame(0, variation=1)[0]).get_json()['reason'] == 'face_too_small'
+
+
+def test_a_usable_frame_marks_the_student_once(attendance, enrolled, client):
+    frame = make_frame(1, variation=1)[0]
+    response = mark(client, frame)
+    assert response.status_code == 200
+    assert response.get_json()['success'] is True
+
+    again = mark(client, frame)
+    assert again.status_code == 400
+    assert 'already marked' in again.get_json()['message']
+
+    conn = attendance.get_db()
+    marked = [row[0] for row in conn.execute('SELECT student_id FROM attendance')]
+    conn.close()
+    assert marked == [enrolled[1]]
+
+
+def test_mark_attendance_needs_a_login(attendance):
+    response = attendance.app.test_client().post('/mark_attendance', json={'image_data': 'x'})
+    assert response.status_code == 401
+
+
+def png_data_url(image):
+    return 'data:image/png;base64,' + base64.b64encode(cv2.imencode('.png', image)[1].tobytes()).decode('ascii')
+
+
+def test_a_browser_face_crop_marks_the_student(attendance, enrolled, client):
+    response = client.post('/mark_attendance/face', json={'face_data': png_data_url(draw_face(2, variation=1))})
+    assert response.status_code == 200
+    assert response.get_json()['success'] is True
+
+    conn = attendance.get_db()
+    assert [row[0] for row in conn.execute('SELECT student_id FROM attendance')] == [enrolled[2]]
+    conn.close()
+
+
+@pytest.mark.parametrize('face_data, status', [
+    (None, 400),
+    ('data:image/gif;base64,R0lGOD', 400),
+    ('data:image/png;base64,not-base64!', 400),
+    (png_data_url(np.zeros((20, 20), np.uint8)), 400),
+    (png_data_url(np.zeros((128, 200), np.uint8)), 400),
+    ('data:image/png;base64,' + 'A' * (200 * 1024), 413),
+])
+def test_bad_face_crops_are_rejected(enrolled, client, face_data, status):
+    response = client.post('/mark_attendance/face', json={'face_data': face_data})
+    assert response.status_code == status
+    assert response.get_json()['success'] is False
+
+
+def batch(client, frames):
+    return client.post('/mark_attendance/batch', json={'frames': [to_data_url(frame) for frame in frames]})
+
+
+def test_a_burst_marks_everyone_seen_once(attendance, enrolled, client):
+    # Two students side by side, then one of them again in a second frame
+    pair = np.hstack([make_frame(0, variation=1)[0], make_frame(2, variation=1)[0]])
+    response = batch(client, [pair, make_frame(0, variation=2)[0], gray_frame(np.full((480, 640), 10))])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert sorted(student['student_id'] for student in body['marked']) == ['ID0', 'ID2']
+    assert (body['frames'], body['faces'], body['rejected']) == (3, 3, {'too_dark': 1})
+
+    again = batch(client, [make_frame(2, variation=1)[0]]).get_json()
+    assert again['success'] is False
+    assert [student['student_id'] for student in again['already_marked']] == ['ID2']
+
+    conn = attendance.get_db()
+    assert sorted(row[0] for row in conn.execute('SELECT student_id FROM attendance')) == [enrolled[0], enrolled[2]]
+    conn.close()
+
+
+def test_a_burst_with_no_usable_frame_gets_a_hint(attendance, enrolled, client):
+    body = batch(client, [gray_frame(np.full((480, 640), 10))] * 2).get_json()
+    assert (body['reason'], body['message']) == ('too_dark', attendance.TRIAGE_HINTS['too_dark'])
+
+
+@pytest.mark.parametrize('frames, status', [
+    (None, 400),
+    ([], 400),
+    (['data:image/png;base64,AAAA'], 400),
+    (['data:image/jpeg;base64,AAAA'] * 9, 413),
+])
+def test_bad_bursts_are_rejected(attendance, enrolled, client, monkeypatch, frames, status):
+    monkeypatch.setattr(attendance, 'BATCH_MAX_FRAMES', 8)
+    response = client.post('/mark_attendance/batch', json={'frames': frames})
+    assert response.status_code == status
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def sample(text, line_start):
+    """Value of the one exposition line that starts with `line_start`"""
+    values = [line.rsplit(' ', 1)[1] for line in text.splitlines() if line.startswith(line_start)]
+    assert len(values) == 1, values
+    return float(values[0])
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_scrape_adds_up_every_process(tmp_path):
+    registry = Registry()
+    requests = registry.register(Counter('requests_total', 'Requests', ['route']))
+    in_flight = registry.register(Gauge('in_flight', 'In flight'))
+    version = registry.register(Gauge('version', 'Model version', multiprocess='max'))
+    latency = registry.register(Histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0)))
+    registry.enable_multiprocess(str(tmp_path), flush_seconds=3600)
+    requests.inc(route='/a')
+    in_flight.set(1)
+    version.set(3)
+
+    # A worker that serves requests, is scraped, and then exits
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            requests.inc(2, route='/a')
+            requests.inc(route='/b')
+            in_flight.set(2)
+            version.set(4)
+            latency.observe(0.5)
+            text = registry.render()
+            ok = (sample(text, 'requests_total{route="/a"}') == 3 and sample(text, 'in_flight') == 3
+                  and sample(text, 'version') == 4 and sample(text, 'latency_seconds_count') == 1)
+        except Exception:
+            ok = False
+        os.write(write, b'1' if ok else b'0')
+        os._exit(0)
+    os.close(write)
+    try:
+        assert os.read(read, 1) == b'1'
+    finally:
+        os.close(read)
+        os.waitpid(pid, 0)
+
+    text = registry.render()
+    # The exited worker's counts stay; its gauges are gone
+    assert sample(text, 'requests_total{route="/a"}') == 3
+    assert sample(text, 'requests_total{route="/b"}') == 1
+    assert sample(text, 'latency_seconds_bucket{le="1"}') == 1
+    assert sample(text, 'in_flight') == 1
+    assert sample(text, 'version') == 3
+
+
+def test_files_of_finished_servers_are_removed(tmp_path):
+    stale = tmp_path / '999999999.json'
+    stale.write_text('{"requests_total": [[["/a"], 5]]}')
+    registry = Registry()
+    requests = registry.register(Counter('requests_total', 'Requests', ['route']))
+    registry.enable_multiprocess(str(tmp_path), flush_seconds=3600)
+    requests.inc(route='/a')
+
+    assert not stale.exists()
+    assert sample(registry.render(), 'requests_total{route="/a"}') == 1
+
+
+def test_metrics_route(attendance, monkeypatch):
+    client = attendance.app.test_client()
+    client.get('/healthz')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'attendance_http_request_duration_seconds_count{route="/healthz",method="GET",status="200"}' in text
+
+    monkeypatch.setattr(attendance, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
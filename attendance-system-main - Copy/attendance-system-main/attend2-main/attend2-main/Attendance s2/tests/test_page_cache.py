@@ -0,0 +1,60 @@
+from conftest import add_students
+
+
+def test_unchanged_page_is_304(attendance, client):
+    add_students(attendance, 'Ada Lovelace')
+    page = client.get('/students')
+    assert page.status_code == 200
+    assert page.headers['ETag']
+    assert page.headers['Cache-Control'] in ('private, no-cache', 'no-cache, private')
+
+    again = client.get('/students', headers={'If-None-Match': page.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == page.headers['ETag']
+    assert again.get_data() == b''
+
+
+def test_a_write_changes_the_etag(attendance, client):
+    ada, = add_students(attendance, 'Ada Lovelace')
+    etag = client.get('/students').headers['ETag']
+
+    conn = attendance.get_db()
+    conn.execute("UPDATE students SET name = 'Alan Turing' WHERE id = ?", (ada,))
+    conn.commit()
+    conn.close()
+    page = client.get('/students', headers={'If-None-Match': etag})
+    assert page.status_code == 200
+    assert page.headers['ETag'] != etag
+    assert 'Alan Turing' in page.get_data(as_text=True)
+
+
+def test_etag_depends_on_the_query_and_the_user(attendance, client):
+    add_students(attendance, 'Ada Lovelace')
+    etag = client.get('/students').headers['ETag']
+    assert client.get('/students?q=ada', headers={'If-None-Match': etag}).status_code == 200
+
+    with client.session_transaction() as session:
+        session.update(user_id=2, username='other', role='admin')
+    assert client.get('/students', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_pending_flash_messages_are_always_rendered(attendance, client):
+    etag = client.get('/students').headers['ETag']
+    with client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Saved')]
+    page = client.get('/students', headers={'If-None-Match': etag})
+    assert page.status_code == 200
+    assert 'Saved' in page.get_data(as_text=True)
+
+
+def test_daily_report_changes_when_attendance_is_marked(attendance, client):
+    ada, = add_students(attendance, 'Ada Lovelace')
+    etag = client.get('/daily_attendance_report').headers['ETag']
+    assert client.get('/daily_attendance_report', headers={'If-None-Match': etag}).status_code == 304
+
+    conn = attendance.get_db()
+    conn.execute("INSERT INTO attendance (student_id, date, time, marked_by) VALUES (?, date('now', 'localtime'), '08:00:00', 1)",
+                 (ada,))
+    conn.commit()
+    conn.close()
+    assert client.get('/daily_attendance_report', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,76 @@
+import pytest
+
+from profiling import RequestProfiler
+
+
+@pytest.fixture
+def profiler(attendance, tmp_path, monkeypatch):
+    """A profiler saving the newest three profiles under tmp_path, switched off"""
+    directory = str(tmp_path / 'profiles')
+    profiler = RequestProfiler(directory, keep=3)
+    monkeypatch.setattr(attendance, 'request_profiler', profiler)
+    monkeypatch.setattr(attendance, 'PROFILE_DIR', directory)
+    return profiler
+
+
+def switch_on(client, **settings):
+    response = client.post('/admin/profiling', json=settings)
+    assert response.status_code == 200
+    return response.get_json()['settings']
+
+
+def test_requests_are_not_profiled_while_switched_off(profiler, client):
+    assert client.get('/admin/profiling').get_json()['settings'] is None
+    assert 'X-Profile-Id' not in client.get('/students', headers={'X-Profile': '1'}).headers
+    assert profiler.ids() == []
+
+
+def test_header_profiles_one_request(profiler, client):
+    switch_on(client, header=True)
+    assert 'X-Profile-Id' not in client.get('/students').headers
+    profile_id = client.get('/students', headers={'X-Profile': '1'}).headers['X-Profile-Id']
+    # Probes and the profile endpoints themselves are never profiled
+    assert 'X-Profile-Id' not in client.get('/healthz', headers={'X-Profile': '1'}).headers
+
+    listed = client.get('/admin/profiles').get_json()['profiles']
+    assert [(p['id'], p['trigger'], p['route'], p['status'], p['user']) for p in listed] == [
+        (profile_id, 'header', '/students', 200, 'admin')]
+
+    record = client.get(f'/admin/profiles/{profile_id}').get_json()['profile']
+    assert record['top_functions'] and record['memory'] is None
+    assert 'function calls' in client.get(f'/admin/profiles/{profile_id}?format=text&sort=tottime').get_data(as_text=True)
+    raw = client.get(f'/admin/profiles/{profile_id}?format=prof')
+    assert raw.status_code == 200 and raw.get_data()
+
+
+def test_sampling_and_memory_profiles(profiler, client):
+    switch_on(client, sample_rate=1, header=False, memory=True)
+    profile_id = client.get('/students').headers['X-Profile-Id']
+    record = client.get(f'/admin/profiles/{profile_id}').get_json()['profile']
+    assert record['trigger'] == 'sample'
+    assert record['memory']['peak_bytes'] > 0
+
+
+def test_only_the_newest_profiles_are_kept(profiler, client):
+    switch_on(client, sample_rate=1)
+    ids = [client.get('/students').headers['X-Profile-Id'] for _ in range(5)]
+    assert profiler.ids() == ids[:-4:-1]
+    assert client.get(f'/admin/profiles/{ids[0]}').status_code == 404
+
+
+def test_switching_off(profiler, client):
+    switch_on(client, sample_rate=1)
+    assert switch_on(client, sample_rate=1, minutes=0) is None
+    assert 'X-Profile-Id' not in client.get('/students').headers
+
+
+def test_profiling_endpoints_are_admin_only(attendance, profiler, client):
+    assert client.post('/admin/profiling', json={'sample_rate': 'lots'}).status_code == 400
+    assert client.get('/admin/profiles/../settings').status_code == 404
+    assert client.get('/admin/profiles/20260101T000000-000000-abcdef').status_code == 404
+
+    teacher = attendance.app.test_client()
+    with teacher.session_transaction() as session:
+        session.update(user_id=2, username='teacher', role='teacher', tenant=None)
+    assert teacher.post('/admin/profiling', json={'sample_rate': 1}).status_code == 403
+    assert teacher.get('/admin/profiles').status_code == 403
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from conftest import add_students
+from snapshot import SnapshotBusy, SnapshotReader, snapshot_path
+
+
+@pytest.fixture
+def source(tmp_path):
+    """A small database with a few pages of data"""
+    path = str(tmp_path / 'source.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, payload TEXT)')
+    conn.executemany('INSERT INTO t (payload) VALUES (?)', [('x' * 500,) for _ in range(200)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def count(conn):
+    try:
+        return conn.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def add_row(path):
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO t (payload) VALUES ('y')")
+    conn.commit()
+    conn.close()
+
+
+def test_snapshot_is_reused_until_it_is_too_old(source):
+    reader = SnapshotReader(max_age=60)
+    conn, taken = reader.connect(source)
+    assert count(conn) == 200
+    assert os.path.exists(snapshot_path(source))
+
+    add_row(source)
+    conn, again = reader.connect(source)
+    assert (count(conn), again) == (200, taken)
+
+    reader.max_age = 0
+    conn, refreshed = reader.connect(source)
+    assert count(conn) == 201 and refreshed > taken
+
+
+def test_unchanged_source_is_not_copied_again(source):
+    refreshes = []
+    reader = SnapshotReader(max_age=0, on_refresh=lambda *args: refreshes.append(args))
+    _, taken = reader.connect(source)
+    time.sleep(0.01)
+    _, again = reader.connect(source)
+    assert again == taken
+    assert len(refreshes) == 1
+
+
+def test_busy_refresh_falls_back_to_the_previous_snapshot(source, monkeypatch):
+    busy = []
+    reader = SnapshotReader(max_age=0, on_busy=lambda path, error: busy.append(path))
+    _, taken = reader.connect(source)
+    add_row(source)
+
+    def give_up(path):
+        raise SnapshotBusy('busy')
+    monkeypatch.setattr(reader, 'refresh', give_up)
+    conn, again = reader.connect(source)
+    assert (count(conn), again) == (200, taken)
+    assert busy == [source]
+
+
+def test_busy_refresh_without_a_snapshot_reads_the_live_database(source, monkeypatch):
+    reader = SnapshotReader(max_age=60)
+
+    def give_up(path):
+        raise SnapshotBusy('busy')
+    monkeypatch.setattr(reader, 'refresh', give_up)
+    before = time.time()
+    conn, taken = reader.connect(source)
+    assert count(conn) == 200 and taken >= before
+    assert not os.path.exists(snapshot_path(source))
+
+
+def test_copy_restarted_by_writes_gives_up(source):
+    reader = SnapshotReader(max_age=60, step_pages=1, step_pause=0.005, max_restarts=0)
+    stop = threading.Event()
+
+    def keep_writing():
+        while not stop.is_set():
+            add_row(source)
+
+    writer = threading.Thread(target=keep_writing)
+    writer.start()
+    try:
+        with pytest.raises(SnapshotBusy):
+            reader.refresh(source)
+    finally:
+        stop.set()
+        writer.join()
+    # Nothing half-copied is left behind
+    assert os.listdir(os.path.dirname(source)) == ['source.db']
+
+
+def test_history_is_served_while_snapshots_are_busy(attendance, client, monkeypatch):
+    ada, = add_students(attendance, 'Ada Lovelace')
+    conn = attendance.get_db()
+    conn.execute("INSERT INTO attendance (student_id, date, time, marked_by) VALUES (?, '2025-03-03', '08:00:00', 1)",
+                 (ada,))
+    conn.commit()
+    conn.close()
+
+    reader = SnapshotReader(max_age=60)
+
+    def give_up(path):
+        raise SnapshotBusy('busy')
+    monkeypatch.setattr(reader, 'refresh', give_up)
+    monkeypatch.setattr(attendance, 'SNAPSHOT_MAX_AGE', reader.max_age)
+    monkeypatch.setattr(attendance, 'report_snapshots', reader)
+    response = client.get('/api/attendance/history')
+    assert response.status_code == 200
+    assert [record['student']['id'] for record in response.get_json()['records']] == [ada]
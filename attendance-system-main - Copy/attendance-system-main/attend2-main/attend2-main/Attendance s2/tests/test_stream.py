@@ -0,0 +1,76 @@
+import cv2
+import pytest
+
+from synthetic_faces import make_frame
+
+
+@pytest.fixture
+def streams(attendance, monkeypatch):
+    monkeypatch.setattr(attendance, '_streams', {})
+    monkeypatch.setattr(attendance, 'STREAM_DETECT_EVERY', 5)
+    monkeypatch.setattr(attendance, 'STREAM_STABLE_VOTES', 3)
+    return attendance
+
+
+def jpeg(frame):
+    return cv2.imencode('.jpg', frame)[1].tobytes()
+
+
+def start(client):
+    response = client.post('/stream/start')
+    assert response.status_code == 200
+    return response.get_json()['stream_id']
+
+
+def send(client, stream_id, frame):
+    return client.post(f'/stream/{stream_id}/frame', data=jpeg(frame), content_type='image/jpeg')
+
+
+def test_a_student_in_view_is_marked_once(streams, enrolled, client):
+    stream_id = start(client)
+    events = []
+    for variation in range(20):
+        body = send(client, stream_id, make_frame(1, variation=variation % 3)[0]).get_json()
+        assert body['success'] is True
+        events += body['events']
+    assert [(event['type'], event['student_id']) for event in events] == [('marked', 'ID1')]
+    assert body['tracks'] and body['frame'] == 20
+
+    # Only every fifth frame runs the detector
+    counts = client.delete(f'/stream/{stream_id}').get_json()
+    assert counts['frames'] == 20
+    assert counts['detect'] == 4
+    assert send(client, stream_id, make_frame(1)[0]).status_code == 404
+
+    conn = streams.get_db()
+    assert [row[0] for row in conn.execute('SELECT student_id FROM attendance')] == [enrolled[1]]
+    conn.close()
+
+
+def test_streams_belong_to_their_user(streams, enrolled, client):
+    stream_id = start(client)
+    other = streams.app.test_client()
+    with other.session_transaction() as session:
+        session.update(user_id=2, username='teacher', role='teacher', tenant=None)
+    assert send(other, stream_id, make_frame(1)[0]).status_code == 404
+    assert other.delete(f'/stream/{stream_id}').status_code == 404
+    assert send(client, 'nope', make_frame(1)[0]).status_code == 404
+
+
+def test_bad_frames_are_rejected(streams, enrolled, client, monkeypatch):
+    stream_id = start(client)
+    response = client.post(f'/stream/{stream_id}/frame', data=b'not a jpeg', content_type='image/jpeg')
+    assert response.status_code == 400
+    monkeypatch.setattr(streams, 'STREAM_MAX_FRAME_BYTES', 1024)
+    assert send(client, stream_id, make_frame(1)[0]).status_code == 413
+
+
+def test_idle_streams_expire(streams, enrolled, client, monkeypatch):
+    stream_id = start(client)
+    monkeypatch.setattr(streams, 'STREAM_IDLE_SECONDS', -1)
+    start(client)
+    assert send(client, stream_id, make_frame(1)[0]).status_code == 404
+
+
+def test_streams_need_a_login(streams):
+    assert streams.app.test_client().post('/stream/start').status_code == 401
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import add_students
+
+
+def mark_today(attendance, student):
+    conn = attendance.get_db()
+    conn.execute('INSERT INTO attendance (student_id, date, time, marked_by) VALUES (?, ?, ?, 1)',
+                 (student, datetime.now().date().isoformat(), '08:00:00'))
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    ['student'],
+    {'type': 'student', 'student_name': None},
+    {'type': 'student', 'student_name': 7},
+    {'type': 'student', 'id': 'abc'},
+    {'type': 'student', 'id': 1.5},
+    {'type': 'student', 'id': True},
+])
+def test_reset_rejects_malformed_input(client, body):
+    response = client.post('/reset_attendance', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_reset_by_id(attendance, client):
+    ada, _ = add_students(attendance, 'Ada Lovelace', 'Alan Turing')
+    mark_today(attendance, ada)
+
+    response = client.post('/reset_attendance', json={'type': 'student', 'id': ada, 'student_name': None})
+    assert response.status_code == 200
+    assert response.get_json()['success'] is True
+    assert client.post('/reset_attendance', json={'type': 'student', 'id': ada}).get_json()['success'] is False
+    assert client.post('/reset_attendance', json={'type': 'student', 'id': 999}).status_code == 404
+
+
+def test_reset_by_name_must_name_one_student(attendance, client):
+    ada, _ = add_students(attendance, 'Ada Lovelace', 'Ada Byron')
+    mark_today(attendance, ada)
+
+    response = client.post('/reset_attendance', json={'type': 'student', 'student_name': 'ada'})
+    assert response.status_code == 409
+    assert len(response.get_json()['matches']) == 2
+
+    response = client.post('/reset_attendance', json={'type': 'student', 'student_name': 'lovelace'})
+    assert response.get_json()['success'] is True
+
+
+def test_student_total_counts_days_attended(attendance, client):
+    ada, = add_students(attendance, 'Ada Lovelace')
+    conn = attendance.get_db()
+    conn.executemany('INSERT INTO attendance (student_id, date, time, status, marked_by) VALUES (?, ?, ?, ?, ?)', [
+        (ada, '2026-01-05', '08:00:00', 'present', 1),
+        (ada, '2026-01-06', '09:30:00', 'late', 1),
+        # Written by finalize.py for a day the student missed
+        (ada, '2026-01-07', '23:59:59', 'absent', None),
+    ])
+    conn.commit()
+    conn.close()
+
+    stats = client.get(f'/api/students/{ada}').get_json()['stats']
+    assert (stats['total'], stats['present'], stats['absent'], stats['late']) == (2, 1, 1, 1)
+    assert stats['last']['date'] == '2026-01-06'
+    assert client.get('/api/students/999').status_code == 404
+
+
+def search(client, text, **params):
+    response = client.get('/api/students/search', query_string={'q': text, **params})
+    assert response.status_code == 200
+    return [student['name'] for student in response.get_json()['students']]
+
+
+def test_search_by_name_id_or_email_prefix(attendance, client):
+    add_students(attendance, 'Ada Lovelace', 'Alan Turing', 'Grace Hopper')
+
+    assert search(client, 'lov') == ['Ada Lovelace']
+    assert search(client, 'ID2') == ['Grace Hopper']
+    assert search(client, 'alan@') == ['Alan Turing']
+    assert sorted(search(client, 'a')) == ['Ada Lovelace', 'Alan Turing']
+    assert len(search(client, 'a', limit=1)) == 1
+    # FTS syntax in the input is matched as text, not run as a query
+    assert search(client, '" OR * NEAR(') == []
+    assert search(client, '') == []
+
+
+def test_search_index_follows_the_students_table(attendance, client):
+    ada, alan = add_students(attendance, 'Ada Lovelace', 'Alan Turing')
+    conn = attendance.get_db()
+    conn.execute("UPDATE students SET name = 'Ada King' WHERE id = ?", (ada,))
+    conn.commit()
+    conn.close()
+
+    assert search(client, 'lovelace') == []
+    assert search(client, 'king') == ['Ada King']
+
+    assert client.post(f'/delete_student/{alan}').get_json()['success'] is True
+    assert search(client, 'turing') == []
+
+
+def test_directory_search(attendance, client):
+    add_students(attendance, 'Ada Lovelace', 'Alan Turing')
+
+    page = client.get('/students', query_string={'q': 'turing'}).get_data(as_text=True)
+    assert 'Alan Turing' in page and 'Ada Lovelace' not in page
+    page = client.get('/students').get_data(as_text=True)
+    assert 'Alan Turing' in page and 'Ada Lovelace' in page
+
+
+def test_search_needs_a_login(attendance):
+    assert attendance.app.test_client().get('/api/students/search?q=a').status_code == 403
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from conftest import add_students
+from tenancy import ModelCache, TenantMiddleware, use_tenant
+
+
+@pytest.fixture
+def schools(attendance, tmp_path, monkeypatch):
+    """Schools alpha (student Ada) and beta (student Alan) served by path; returns the app"""
+    monkeypatch.setattr(attendance, 'TENANT_MODE', 'path')
+    monkeypatch.setattr(attendance, 'TENANTS_DIR', str(tmp_path / 'tenants'))
+    monkeypatch.setattr(attendance.app, 'wsgi_app',
+                        TenantMiddleware(attendance.app.wsgi_app, 'path', attendance.TENANTS_DIR))
+    for name, student in (('alpha', 'Ada Lovelace'), ('beta', 'Alan Turing')):
+        os.makedirs(tmp_path / 'tenants' / name)
+        with use_tenant(name):
+            attendance.init_db()
+            add_students(attendance, student)
+    return attendance
+
+
+def log_in(client, school):
+    return client.post(f'/{school}/login', data={'username': 'admin', 'password': 'admin123'})
+
+
+def test_requests_are_routed_by_school(schools):
+    client = schools.app.test_client()
+    assert client.get('/alpha/login').status_code == 200
+    assert client.get('/nope/login').status_code == 404
+    assert client.get('/login').status_code == 404
+    # Shared paths need no school
+    assert client.get('/healthz').status_code == 200
+
+
+def test_links_stay_inside_the_school(schools):
+    client = schools.app.test_client()
+    assert log_in(client, 'alpha').headers['Location'] == '/alpha/dashboard'
+
+
+def test_each_school_reads_its_own_database(schools):
+    client = schools.app.test_client()
+    log_in(client, 'alpha')
+    page = client.get('/alpha/students').get_data(as_text=True)
+    assert 'Ada Lovelace' in page and 'Alan Turing' not in page
+
+    log_in(client, 'beta')
+    found = client.get('/beta/api/students/search?q=a').get_json()['students']
+    assert [student['name'] for student in found] == ['Alan Turing']
+    # The single-school database is not touched
+    conn = schools.get_db()
+    assert conn.execute('SELECT COUNT(*) FROM students').fetchone()[0] == 0
+    conn.close()
+
+
+def test_a_login_does_not_carry_over_to_another_school(schools):
+    client = schools.app.test_client()
+    log_in(client, 'alpha')
+    assert client.get('/alpha/students').status_code == 200
+
+    response = client.get('/beta/students')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/beta/login'
+    # ...and visiting the other school signed out of this one
+    assert client.get('/alpha/students').status_code == 302
+
+
+def test_subdomain_routing(schools, monkeypatch):
+    monkeypatch.setattr(schools.app, 'wsgi_app', TenantMiddleware(schools.app.wsgi_app.wsgi_app, 'subdomain',
+                                                                 schools.TENANTS_DIR, 'attendance.example.com'))
+    client = schools.app.test_client()
+    assert client.get('/login', base_url='http://alpha.attendance.example.com').status_code == 200
+    assert client.get('/login', base_url='http://nope.attendance.example.com').status_code == 404
+    assert client.get('/login', base_url='http://attendance.example.com').status_code == 404
+
+
+def test_model_cache_evicts_least_recently_used_over_budget():
+    evicted = []
+    cache = ModelCache(100, 3600, lambda key, reason: evicted.append((key, reason)))
+    cache.touch('alpha', 40)
+    cache.touch('beta', 40)
+    cache.touch('alpha')
+    cache.touch('gamma', 40)
+    assert evicted == [('beta', 'budget')]
+    assert ('alpha' in cache, 'gamma' in cache, cache.bytes) == (True, True, 80)
+    # The model in use stays even when it alone is over budget
+    cache.touch('delta', 500)
+    assert 'delta' in cache and len(cache) == 1
+
+
+def test_model_cache_evicts_idle_models():
+    evicted = []
+    cache = ModelCache(10 ** 9, 0, lambda key, reason: evicted.append((key, reason)))
+    cache.touch('alpha', 1)
+    cache.touch('beta', 1)
+    assert evicted == [('alpha', 'idle')]
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from synthetic_faces import enrollment_face
+from tenancy import ModelCache, TenantMiddleware, use_tenant
+
+
+def enroll(app, count):
+    """Enroll `count` synthetic students in the current database and train its model"""
+    slots = app.get_face_store().extend(app.preprocess_faces([enrollment_face(i) for i in range(count)]))
+    conn = app.get_db()
+    conn.executemany('INSERT INTO students (name, student_id, face_slot) VALUES (?, ?, ?)',
+                     [(f'Student {slot}', f'ID{slot}', slot) for slot in slots])
+    conn.commit()
+    conn.close()
+    app.train_face_recognizer()
+
+
+@pytest.fixture
+def fresh_state(attendance, monkeypatch):
+    """No model loaded in this process, and warm-up not run yet"""
+    monkeypatch.setattr(attendance, 'model_cache', ModelCache(attendance.MODEL_CACHE_BYTES,
+                                                              attendance.MODEL_IDLE_SECONDS,
+                                                              attendance.unload_face_recognizer))
+    monkeypatch.setattr(attendance, 'warmed_up', None)
+    return attendance
+
+
+@pytest.fixture
+def schools(fresh_state, tmp_path, monkeypatch):
+    """Three schools with a trained model each, written to in the order alpha, beta, gamma"""
+    app = fresh_state
+    monkeypatch.setattr(app, 'TENANT_MODE', 'path')
+    monkeypatch.setattr(app, 'TENANTS_DIR', str(tmp_path / 'tenants'))
+    monkeypatch.setattr(app.app, 'wsgi_app', TenantMiddleware(app.app.wsgi_app, 'path', app.TENANTS_DIR))
+    names = ['alpha', 'beta', 'gamma']
+    for age, name in zip((300, 200, 100), names):
+        os.makedirs(tmp_path / 'tenants' / name)
+        with use_tenant(name):
+            app.init_db()
+            enroll(app, 3)
+            mtime = os.path.getmtime(app.database_path()) - age
+            os.utime(app.database_path(), (mtime, mtime))
+    # A fresh process: nothing loaded yet
+    monkeypatch.setattr(app, '_recognizer_states', {})
+    monkeypatch.setattr(app, '_initialized_databases', set())
+    monkeypatch.setattr(app, 'model_cache', ModelCache(app.MODEL_CACHE_BYTES, app.MODEL_IDLE_SECONDS,
+                                                       app.unload_face_recognizer))
+    return app
+
+
+def loaded(app, name):
+    with use_tenant(name):
+        return app.recognizer_state().recognizer is not None
+
+
+def test_warm_up_loads_the_most_recently_active_schools(schools, monkeypatch):
+    monkeypatch.setattr(schools, 'WARM_UP_TENANTS', 2)
+    schools.warm_up()
+
+    assert [loaded(schools, name) for name in ('alpha', 'beta', 'gamma')] == [False, True, True]
+    assert len(schools.model_cache) == 2
+
+
+def test_warm_up_can_leave_every_school_cold(schools, monkeypatch):
+    monkeypatch.setattr(schools, 'WARM_UP_TENANTS', 0)
+    schools.warm_up()
+
+    assert not any(loaded(schools, name) for name in ('alpha', 'beta', 'gamma'))
+    assert schools.warmed_up is not None
+
+
+def test_school_readiness(schools):
+    schools.warm_up()
+    client = schools.app.test_client()
+
+    assert client.get('/healthz').status_code == 200
+    assert client.get('/readyz').get_json() == {'warmed_up': True, 'schools': 3, 'ready': True}
+    ready = client.get('/beta/readyz')
+    assert ready.status_code == 200
+    assert ready.get_json()['gallery_size'] == 3
+    assert client.get('/nope/readyz').status_code == 404
+
+
+def test_readyz_is_503_before_warm_up(fresh_state):
+    response = fresh_state.app.test_client().get('/readyz')
+    assert response.status_code == 503
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_single_school_warm_up_loads_the_model(fresh_state, monkeypatch):
+    enroll(fresh_state, 3)
+    monkeypatch.setattr(fresh_state, '_recognizer_states', {})
+    fresh_state.warm_up()
+
+    assert fresh_state.recognizer_state().recognizer is not None
+    assert fresh_state.app.test_client().get('/readyz').get_json()['ready'] is True